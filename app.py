@@ -1,13 +1,35 @@
-from flask import Flask, request, jsonify, render_template, send_file, send_from_directory, session, redirect, url_for
+from flask import Flask, Response, request, jsonify, render_template, send_file, send_from_directory, session, redirect, url_for, stream_with_context
 import asyncio
+import base64
+import itertools
 import logging
+import threading
+import uuid
 from datetime import datetime
 import os
+import runpy
 import tempfile
 import json
 
+try:
+    from flask_sock import Sock
+except ImportError:  # 可选依赖，未安装时不提供流式ASR接口
+    Sock = None
+
 # 导入服务模块
-from services import LLMService, TTSService, ASRService
+from services import (
+    LLMService, TTSService, ASRService, SensitiveFilter, SensitiveEventLog,
+    ProviderSessionPool, TTSPipeline, TTSCache, AsyncRunner, LocalASRPool, AsyncLLMService,
+    LLMResponseCache, ChatHistoryStore, ProviderRouter, Live2DCatalog, AssetPipeline, TTSWarmup,
+    UsageTracker
+)
+
+if __name__ == '__main__':
+    # 直接运行本文件时改由 server.py 启动：本地ASR的 spawn 工作进程会重新执行
+    # 主模块，主模块必须是不创建服务的小入口
+    runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py'),
+                   run_name='__main__')
+    raise SystemExit
 
 app = Flask(__name__)
 app.secret_key = 'parent_mode_secret_key'  # 用于session
@@ -17,11 +39,135 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # 初始化服务
-llm_service = LLMService()
-tts_service = TTSService()
-asr_service = ASRService()
+async_runner = AsyncRunner(max_concurrency=int(os.environ.get('ASYNC_MAX_CONCURRENCY', 32)))
+provider_sessions = ProviderSessionPool(
+    pool_size=int(os.environ.get('LLM_POOL_SIZE', 10)),
+    timeout=(float(os.environ.get('LLM_CONNECT_TIMEOUT', 5)), float(os.environ.get('LLM_READ_TIMEOUT', 30))),
+    max_retries=int(os.environ.get('LLM_MAX_RETRIES', 2)),
+    backoff_factor=float(os.environ.get('LLM_RETRY_BACKOFF', 0.5))
+)
+# 设置 LLM_CACHE=1 启用回复缓存；LLM_CACHE_SIMILARITY (如 0.8) 同时启用近似提问命中
+llm_cache = None
+if os.environ.get('LLM_CACHE', '').lower() in ('1', 'true', 'yes'):
+    llm_cache = LLMResponseCache(
+        max_entries=int(os.environ.get('LLM_CACHE_SIZE', 1000)),
+        ttl=float(os.environ.get('LLM_CACHE_TTL', 3600)),
+        similarity_threshold=float(os.environ['LLM_CACHE_SIMILARITY']) if os.environ.get('LLM_CACHE_SIMILARITY') else None
+    )
+
+# LLM_ROUTING=failover 在提供商失败/熔断时转移，=hedged 还会在主请求超过 p95 时
+# 向备用提供商发送对冲请求；备用凭据来自请求中的 fallback 或以下环境变量
+llm_router = None
+if os.environ.get('LLM_ROUTING') in ('failover', 'hedged'):
+    llm_router = ProviderRouter(
+        credentials={
+            'deepseek': {'api_key': os.environ.get('DEEPSEEK_API_KEY', ''), 'model': 'DeepSeek-V3'},
+            'kimi': {'api_key': os.environ.get('KIMI_API_KEY', ''),
+                     'model': os.environ.get('KIMI_MODEL', 'moonshot-v1-8k')}
+        },
+        hedge=os.environ['LLM_ROUTING'] == 'hedged',
+        default_hedge_delay=float(os.environ.get('LLM_HEDGE_DELAY', 4.0))
+    )
+
+# LLM_BACKEND=async 时改用 aiohttp 异步后端：上游请求集中在独立的事件循环中，
+# temperature 为 0 的相同并发请求合并为一次调用
+if os.environ.get('LLM_BACKEND') == 'async':
+    llm_service = AsyncLLMService(
+        AsyncRunner(max_concurrency=int(os.environ.get('LLM_ASYNC_MAX_CONCURRENCY', 256)), name='llm-runner'),
+        pool_size=int(os.environ.get('LLM_POOL_SIZE', 100)),
+        connect_timeout=float(os.environ.get('LLM_CONNECT_TIMEOUT', 5)),
+        read_timeout=float(os.environ.get('LLM_READ_TIMEOUT', 30)),
+        max_retries=int(os.environ.get('LLM_MAX_RETRIES', 2)),
+        backoff_factor=float(os.environ.get('LLM_RETRY_BACKOFF', 0.5)),
+        cache=llm_cache
+    )
+    if llm_router:
+        # 异步后端没有接入 ProviderRouter，两个开关同时设置时路由不会生效
+        logger.warning("LLM_BACKEND=async 不支持 LLM_ROUTING，提供商转移/对冲已停用")
+else:
+    llm_service = LLMService(session_pool=provider_sessions, cache=llm_cache, router=llm_router)
+tts_cache = TTSCache(
+    cache_dir=os.environ.get('TTS_CACHE_DIR', 'tts_cache'),
+    memory_max_bytes=int(os.environ.get('TTS_CACHE_MEMORY_MB', 16)) * 1024 * 1024,
+    disk_max_bytes=int(os.environ.get('TTS_CACHE_DISK_MB', 256)) * 1024 * 1024
+)
+tts_service = TTSService(
+    cache=tts_cache,
+    chunk_chars=int(os.environ.get('TTS_CHUNK_CHARS', 200)),
+    max_parallel_chunks=int(os.environ.get('TTS_CHUNK_PARALLEL', 4))
+)
+# 设置 LOCAL_ASR_MODEL（如 small、base 或本地模型目录）启用本地离线ASR引擎
+local_asr_pool = None
+if os.environ.get('LOCAL_ASR_MODEL'):
+    if LocalASRPool.available():
+        local_asr_pool = LocalASRPool(
+            model_size=os.environ['LOCAL_ASR_MODEL'],
+            workers=int(os.environ.get('LOCAL_ASR_WORKERS', 2)),
+            cpu_threads=int(os.environ.get('LOCAL_ASR_THREADS', 2)),
+            batch_size=int(os.environ.get('LOCAL_ASR_BATCH_SIZE', 0))
+        )
+    else:
+        logger.warning("已设置 LOCAL_ASR_MODEL 但未安装 faster-whisper，本地ASR引擎不可用")
+asr_service = ASRService(session_pool=provider_sessions, local_pool=local_asr_pool)
+tts_pipeline = TTSPipeline(tts_service, async_runner, max_in_flight=int(os.environ.get('TTS_PIPELINE_IN_FLIGHT', 3)))
+# 固定短语预合成（TTS_WARMUP=0 关闭），TTS_WARMUP_VOICES 为启动时预热的声音，逗号分隔；
+# TTS_WARMUP_PHRASES 可指定短语 JSON 文件（字符串数组）
+canned_phrases = TTSWarmup.load_phrases(os.environ.get('TTS_WARMUP_PHRASES'))
+tts_warmup = None
+if os.environ.get('TTS_WARMUP', '1') != '0':
+    tts_warmup = TTSWarmup(
+        tts_service, async_runner,
+        phrases=canned_phrases,
+        voices=[v.strip() for v in os.environ.get('TTS_WARMUP_VOICES', 'zh-CN-XiaoxiaoNeural').split(',') if v.strip()],
+        max_profiles=int(os.environ.get('TTS_WARMUP_MAX_PROFILES', 8))
+    )
+sensitive_filter = SensitiveFilter('sensitive_words.json')
+usage_tracker = UsageTracker(
+    'usage_record.json', 'time_limit.json',
+    flush_interval=float(os.environ.get('USAGE_FLUSH_INTERVAL', 10))
+)
+sensitive_log_store = SensitiveEventLog('sensitive_log.jsonl', legacy_path='sensitive_log.json')
+history_store = ChatHistoryStore(os.environ.get('CHAT_HISTORY_DB', 'chat_history.db'))
+asset_pipeline = AssetPipeline(app.static_folder)
+try:
+    asset_pipeline.ensure_built()
+except OSError as e:
+    # 构建失败时模板退回未压缩的原始路径
+    logger.error(f"静态资源构建失败: {str(e)}")
+app.add_template_global(asset_pipeline.url, name='asset_url')
+live2d_catalog = Live2DCatalog(
+    os.path.join(app.static_folder, 'live2d_models'),
+    refresh_interval=float(os.environ.get('LIVE2D_REFRESH_INTERVAL', 5))
+)
+
+def start_background_services():
+    """在处理请求的进程启动时调用：后台预热TTS固定短语、启动本地ASR模型池
+
+    server.py 在开发服务器中调用；以 WSGI 方式部署时在导入 app 后调用一次
+    """
+    if tts_warmup:
+        tts_warmup.start()
+    if local_asr_pool:
+        local_asr_pool.start()
 
 # 添加静态文件路由
+@app.route('/static/dist/<path:filename>')
+def serve_dist_asset(filename):
+    """指纹化的静态资源：按 Accept-Encoding 发送预压缩版本，长期缓存"""
+    path, encoding = asset_pipeline.resolve(filename, request.headers.get('Accept-Encoding', ''))
+    if path is None:
+        return jsonify({'error': '接口不存在'}), 404
+    mimetype = 'text/css' if filename.endswith('.css') else 'application/javascript'
+    # 预压缩文件沿用原始文件名；编码后的字节偏移与原文件不对应，不支持 Range 请求
+    response = send_file(path, mimetype=mimetype, download_name=os.path.basename(filename),
+                         conditional=not encoding)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+        response = response.make_conditional(request, accept_ranges=False)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
 @app.route('/static/live2d_models/<path:filename>')
 def serve_live2d_models(filename):
     return send_from_directory('static/live2d_models', filename)
@@ -32,96 +178,156 @@ def favicon():
     return send_from_directory('static', 'favicon.ico', mimetype='image/vnd.microsoft.icon')
 
 def get_time_limit():
-    try:
-        with open('time_limit.json', 'r', encoding='utf-8') as f:
-            return json.load(f).get('time_limit')
-    except Exception:
-        return None
+    return usage_tracker.time_limit
 
 def set_time_limit(limit):
-    with open('time_limit.json', 'w', encoding='utf-8') as f:
-        json.dump({'time_limit': limit}, f)
+    usage_tracker.set_time_limit(limit)
 
 def get_today_used_minutes():
-    today = datetime.now().strftime('%Y-%m-%d')
-    try:
-        with open('usage_record.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            return data.get(today, 0)
-    except Exception:
-        return 0
+    return usage_tracker.used_minutes()
+
+def get_usage_session_id():
+    """标识一个浏览器会话，用于合并同一会话的心跳"""
+    if 'usage_id' not in session:
+        session['usage_id'] = uuid.uuid4().hex
+    return session['usage_id']
+
+# 今日时长用尽后拒绝的接口（家长模式不受限制）
+TIME_LIMITED_ENDPOINTS = {'chat', 'chat_stream', 'text_to_speech', 'speech_to_text', 'asr_stream'}
+
+def is_canned_tts_request():
+    data = request.get_json(silent=True) or {}
+    text = data.get('text')
+    return isinstance(text, str) and text.strip() in canned_phrases
+
+@app.before_request
+def enforce_time_limit():
+    if request.endpoint not in TIME_LIMITED_ENDPOINTS or session.get('parent_mode'):
+        return None
+    if usage_tracker.is_exhausted():
+        # 时长提醒等固定短语照常合成，否则用尽时的语音提示会被拦下
+        if request.endpoint == 'text_to_speech' and is_canned_tts_request():
+            return None
+        return jsonify({'error': '今日可用时长已用尽，请明天再来', 'code': 'time_limit'}), 403
+    return None
 
 def get_sensitive_words():
-    try:
-        with open('sensitive_words.json', 'r', encoding='utf-8') as f:
-            return json.load(f).get('words', [])
-    except Exception:
-        return []
+    return sensitive_filter.get_words()
 
 def record_sensitive_event(context):
-    from datetime import datetime
-    today = datetime.now().strftime('%Y-%m-%d')
-    try:
-        with open('sensitive_log.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    except Exception:
-        data = {}
-    if today not in data:
-        data[today] = []
-    data[today].append(context)
-    with open('sensitive_log.json', 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    sensitive_log_store.record(context)
 
 def set_sensitive_words(words):
-    with open('sensitive_words.json', 'w', encoding='utf-8') as f:
-        json.dump({'words': words}, f, ensure_ascii=False)
+    sensitive_filter.set_words(words)
 
 @app.route('/')
 def index():
     """主页"""
-    time_limit = get_time_limit()
-    used_minutes = get_today_used_minutes()
-    remaining_minutes = time_limit - used_minutes if time_limit is not None else None
-    return render_template('index.html', remaining_minutes=remaining_minutes)
+    get_usage_session_id()
+    usage = usage_tracker.status()
+    remaining_minutes = int(usage['remaining_minutes']) if usage['remaining_minutes'] is not None else None
+    return render_template('index.html', remaining_minutes=remaining_minutes,
+                           remaining_seconds=usage['remaining_seconds'])
+
+@app.route('/api/usage', methods=['GET'])
+def get_usage():
+    """今日使用时长（内存中的计数，不读文件）"""
+    return jsonify(usage_tracker.status())
+
+@app.route('/api/usage/heartbeat', methods=['POST'])
+def usage_heartbeat():
+    """页面在前台时定期发送心跳，两次心跳之间的时间计入今日用量；
+    页面转入后台时发送 active=false 暂停计时"""
+    data = request.get_json(silent=True) or {}
+    return jsonify(usage_tracker.heartbeat(get_usage_session_id(), active=data.get('active', True) is not False))
+
+def parse_chat_request(data):
+    """解析聊天请求参数，验证配置并做敏感词检测
+
+    请求可以带完整的 messages，也可以只带 {conversation_id, new_message}，
+    由服务端从历史库中取出该会话之前的消息拼出上下文；服务端没有该会话，
+    或客户端带的 history_count（本地已有的消息数）与服务端不一致（如上一轮
+    请求失败，本地多出未保存的消息）时返回 409 (code=sync_required)，
+    客户端需先把完整历史 POST 到 /api/history。
+    
+    Returns:
+        (参数字典, None) 或 (None, 错误响应)
+    """
+    params = {
+        'provider': data.get('provider', 'openai'),
+        'api_key': data.get('api_key', ''),
+        'model': data.get('model', 'gpt-3.5-turbo'),
+        'messages': data.get('messages', []),
+        'temperature': float(data.get('temperature', 0.7))
+    }
+    if isinstance(data.get('fallback'), dict):
+        params['fallback'] = data['fallback']
+    conversation_id = data.get('conversation_id')
+    
+    # 验证配置
+    validation = llm_service.validate_config(params['provider'], params['api_key'], params['model'])
+    if not validation['valid']:
+        return None, (jsonify({'error': f"配置错误: {', '.join(validation['errors'])}"}), 400)
+    
+    new_message = data.get('new_message')
+    if new_message is not None:
+        count = history_store.message_count(conversation_id) if conversation_id else None
+        if count is None:
+            return None, (jsonify({'error': '服务端没有该会话的历史记录，请先同步', 'code': 'sync_required'}), 409)
+        if data.get('history_count') is not None and int(data['history_count']) != count:
+            return None, (jsonify({'error': '服务端的会话历史与本地不一致，请先同步', 'code': 'sync_required'}), 409)
+        if isinstance(new_message, str):
+            new_message = {'role': 'user', 'content': new_message}
+        params['messages'] = history_store.get_messages(conversation_id) + [new_message]
+    
+    # 敏感词检测（只扫描本会话新增的消息）
+    hit = sensitive_filter.scan_conversation(conversation_id, params['messages'])
+    if hit:
+        record_sensitive_event({
+            'time': datetime.now().isoformat(),
+            'conversation_id': conversation_id,
+            'hit_words': hit,
+            'context': params['messages']
+        })
+    
+    return params, None
+
+def save_chat_turn(data, params, reply):
+    """增量模式下把本轮提问和回复追加到服务端历史"""
+    if data.get('new_message') is None or not reply:
+        return
+    try:
+        history_store.append_messages(data['conversation_id'], [
+            params['messages'][-1],
+            {'role': 'assistant', 'content': reply}
+        ])
+    except Exception as e:
+        logger.error(f"Save chat turn error: {str(e)}")
+
+def sse_event(payload):
+    """编码一条Server-Sent Event"""
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def ndjson_tts_event(event):
+    """把 stream_speech_events 的事件编码为一行 NDJSON，音频转为 base64"""
+    if event['type'] == 'audio':
+        event = {'type': 'audio', 'audio': base64.b64encode(event['data']).decode('ascii')}
+    return json.dumps(event, ensure_ascii=False) + '\n'
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
     """聊天API"""
     try:
         data = request.json
-        provider = data.get('provider', 'openai')
-        api_key = data.get('api_key', '')
-        model = data.get('model', 'gpt-3.5-turbo')
-        messages = data.get('messages', [])
-        temperature = float(data.get('temperature', 0.7))
-        
-        # 验证配置
-        validation = llm_service.validate_config(provider, api_key, model)
-        if not validation['valid']:
-            return jsonify({'error': f"配置错误: {', '.join(validation['errors'])}"}), 400
-        
-        # 敏感词检测
-        sensitive_words = get_sensitive_words()
-        if sensitive_words:
-            context_text = '\n'.join([m.get('content', '') for m in messages])
-            hit = [w for w in sensitive_words if w and w in context_text]
-            if hit:
-                record_sensitive_event({
-                    'time': datetime.now().isoformat(),
-                    'hit_words': hit,
-                    'context': messages
-                })
+        params, error = parse_chat_request(data)
+        if error:
+            return error
         
         # 调用LLM服务
-        response = llm_service.call_llm(
-            provider=provider,
-            messages=messages,
-            model=model,
-            temperature=temperature,
-            api_key=api_key
-        )
+        response = llm_service.call_llm(**params)
+        save_chat_turn(data, params, response)
         
-        logger.info(f"Chat request processed: {provider}, model: {model}")
+        logger.info(f"Chat request processed: {params['provider']}, model: {params['model']}")
         
         return jsonify({
             'response': response,
@@ -132,6 +338,64 @@ def chat():
         logger.error(f"Chat error: {str(e)}")
         return jsonify({'error': f'处理请求时出错: {str(e)}'}), 500
 
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """流式聊天API (Server-Sent Events)
+
+    请求中 speak 为真时，回复会按句送入TTS流水线，音频以 audio 事件
+    (base64编码的MP3) 按句子顺序穿插在文本事件之间返回。
+    """
+    try:
+        data = request.json
+        params, error = parse_chat_request(data)
+        if error:
+            return error
+        
+        tts_params = None
+        if data.get('speak'):
+            tts_params = {
+                'engine': data.get('tts_engine', 'edge'),
+                'voice': data.get('voice', 'zh-CN-XiaoxiaoNeural'),
+                'rate': float(data.get('rate', 1.0)),
+                'volume': float(data.get('volume', 1.0))
+            }
+            validation = tts_service.validate_config(**tts_params)
+            if not validation['valid']:
+                return jsonify({'error': f"配置错误: {', '.join(validation['errors'])}"}), 400
+            if tts_warmup:
+                tts_warmup.ensure_voice(tts_params['voice'], tts_params['rate'], tts_params['volume'], tts_params['engine'])
+    except Exception as e:
+        logger.error(f"Chat stream error: {str(e)}")
+        return jsonify({'error': f'处理请求时出错: {str(e)}'}), 500
+    
+    def generate():
+        parts = []
+        try:
+            tokens = llm_service.stream_llm(**params)
+            if tts_params is None:
+                for token in tokens:
+                    parts.append(token)
+                    yield sse_event({'type': 'token', 'content': token})
+            else:
+                for event in tts_pipeline.run(tokens, **tts_params):
+                    if event['type'] == 'audio':
+                        event['audio'] = base64.b64encode(event['audio']).decode('ascii')
+                    else:
+                        parts.append(event['content'])
+                    yield sse_event(event)
+            save_chat_turn(data, params, ''.join(parts))
+            logger.info(f"Chat stream processed: {params['provider']}, model: {params['model']}")
+            yield sse_event({'type': 'done', 'timestamp': datetime.now().isoformat()})
+        except Exception as e:
+            logger.error(f"Chat stream error: {str(e)}")
+            yield sse_event({'type': 'error', 'error': f'处理请求时出错: {str(e)}'})
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/api/tts', methods=['POST'])
 def text_to_speech():
     """语音合成API"""
@@ -148,86 +412,112 @@ def text_to_speech():
         if not text:
             return jsonify({'error': '文本不能为空'}), 400
         
-        # 简化文本清理 - 只移除明显的技术内容
-        cleaned_text = text
-        
-        # 移除明显的URL和邮箱
-        import re
-        cleaned_text = re.sub(r'https?://[^\s]+', '', cleaned_text)
-        cleaned_text = re.sub(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', '', cleaned_text)
-        
-        # 移除极长的字符串（可能是API Key）
-        cleaned_text = re.sub(r'\b[A-Za-z0-9]{25,}\b', '', cleaned_text)
-        
-        # 清理空白
-        cleaned_text = re.sub(r'\s+', ' ', cleaned_text).strip()
-        
-        # 如果清理后文本太短，使用原文本
-        if len(cleaned_text) < 5:
-            cleaned_text = text[:100]  # 截取前100个字符
-        
+        # 清理在 TTSService 内完成（结果按文本缓存），这里只记录日志
+        cleaned_text = tts_service.preview_tts_text(text).text
         logger.info(f"TTS清理后文本: '{cleaned_text[:50]}...', length={len(cleaned_text)}")
         
         # 验证配置
         validation = tts_service.validate_config(engine, voice, rate, volume)
         if not validation['valid']:
             return jsonify({'error': f"配置错误: {', '.join(validation['errors'])}"}), 400
-        
-        # 运行异步TTS生成
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        try:
-            audio_path = loop.run_until_complete(
-                tts_service.generate_speech(
-                    text=cleaned_text,
-                    engine=engine,
-                    voice=voice,
-                    rate=rate,
-                    volume=volume
-                )
-            )
-            
-            logger.info(f"TTS生成成功: audio_path={audio_path}")
-            
-            # 检查文件是否存在且有内容
-            if not os.path.exists(audio_path):
-                logger.error(f"TTS音频文件不存在: {audio_path}")
-                return jsonify({'error': '音频文件生成失败'}), 500
+        if tts_warmup:
+            tts_warmup.ensure_voice(voice, rate, volume, engine)
+        
+        # 流式合成：不写临时文件，Edge 产出的音频块直接写入分块响应；
+        # timing 为真时改为 NDJSON，每行一个音频块 (base64) 或词边界时间轴事件
+        timing = bool(data.get('timing'))
+        if engine in tts_service.streaming_engines and data.get('stream', True):
+            # 音频按内容寻址的缓存键，客户端凭它到 /api/tts/timing 取口型时间轴
+            tts_key = tts_service.cache_key(text, engine, voice, rate, volume)
             
-            file_size = os.path.getsize(audio_path)
-            if file_size == 0:
-                logger.error(f"TTS音频文件为空: {audio_path}")
+            synth = tts_service.stream_speech_events if timing else tts_service.stream_speech
+            chunks = async_runner.iterate(synth(
+                text=text,
+                engine=engine,
+                voice=voice,
+                rate=rate,
+                volume=volume
+            ))
+            # 先取到首个音频块，合成失败时仍能返回错误状态码
+            try:
+                first_chunk = next(chunks)
+            except StopIteration:
+                logger.error("TTS音频为空")
                 return jsonify({'error': '音频文件为空'}), 500
-                
-            logger.info(f"TTS音频文件大小: {file_size} bytes")
             
-            # 返回音频文件
-            response = send_file(
-                audio_path,
-                mimetype='audio/mpeg',
-                as_attachment=False
-            )
-            
-            # 设置清理函数
-            @response.call_on_close
-            def cleanup():
+            def generate():
                 try:
-                    if os.path.exists(audio_path):
-                        os.unlink(audio_path)
-                        logger.debug(f"清理临时文件: {audio_path}")
+                    for chunk in itertools.chain([first_chunk], chunks):
+                        yield ndjson_tts_event(chunk) if timing else chunk
                 except Exception as e:
-                    logger.warning(f"清理文件失败: {e}")
-            
-            return response
+                    logger.error(f"TTS流式输出中断: {str(e)}")
             
-        finally:
-            loop.close()
+            return Response(
+                stream_with_context(generate()),
+                mimetype='application/x-ndjson' if timing else 'audio/mpeg',
+                headers={'X-TTS-Key': tts_key, 'X-Accel-Buffering': 'no'}
+            )
+        
+        # 提交到后台事件循环运行异步TTS生成
+        audio_path = async_runner.run(
+            tts_service.generate_speech(
+                text=text,
+                engine=engine,
+                voice=voice,
+                rate=rate,
+                volume=volume
+            )
+        )
+        
+        logger.info(f"TTS生成成功: audio_path={audio_path}")
+        
+        # 检查文件是否存在且有内容
+        if not os.path.exists(audio_path):
+            logger.error(f"TTS音频文件不存在: {audio_path}")
+            return jsonify({'error': '音频文件生成失败'}), 500
+        
+        file_size = os.path.getsize(audio_path)
+        if file_size == 0:
+            logger.error(f"TTS音频文件为空: {audio_path}")
+            return jsonify({'error': '音频文件为空'}), 500
             
+        logger.info(f"TTS音频文件大小: {file_size} bytes")
+        
+        # 返回音频文件
+        response = send_file(
+            audio_path,
+            mimetype='audio/mpeg',
+            as_attachment=False
+        )
+        
+        # 设置清理函数
+        @response.call_on_close
+        def cleanup():
+            try:
+                if os.path.exists(audio_path):
+                    os.unlink(audio_path)
+                    logger.debug(f"清理临时文件: {audio_path}")
+            except Exception as e:
+                logger.warning(f"清理文件失败: {e}")
+        
+        return response
+
     except Exception as e:
         logger.error(f"TTS处理错误: {str(e)}", exc_info=True)
         return jsonify({'error': f'语音合成失败: {str(e)}'}), 500
 
+@app.route('/api/tts/timing/<tts_key>', methods=['GET'])
+def text_to_speech_timing(tts_key):
+    """按 /api/tts 返回的 X-TTS-Key 取口型时间轴：[[起始毫秒, 时长毫秒, 文本], ...]
+
+    音频仍以二进制流发送，时间轴在合成完成时随音频写入缓存，播放前单独取回
+    """
+    timing = tts_cache.get_timing(tts_key) if tts_service.cache else None
+    if not timing:
+        return jsonify({'error': '时间轴不存在'}), 404
+    return Response(timing, mimetype='application/json',
+                    headers={'Cache-Control': 'private, max-age=86400'})
+
 # 新增API：预览TTS文本
 @app.route('/api/tts/preview', methods=['POST'])
 def preview_tts_text():
@@ -236,13 +526,15 @@ def preview_tts_text():
         data = request.json
         text = data.get('text', '')
         
-        cleaned_text = tts_service.preview_tts_text(text)
+        cleaned = tts_service.preview_tts_text(text)
         
         return jsonify({
             'original_text': text,
-            'cleaned_text': cleaned_text,
+            'cleaned_text': cleaned.text,
             'original_length': len(text),
-            'cleaned_length': len(cleaned_text),
+            'cleaned_length': len(cleaned.text),
+            # [清理后起点, 清理后终点, 原文起点, 原文终点]，用于在原文上高亮
+            'spans': [list(span) for span in cleaned.spans],
             'timestamp': datetime.now().isoformat()
         })
         
@@ -272,39 +564,114 @@ def speech_to_text():
         if 'audio' not in request.files:
             return jsonify({'error': '未找到音频文件'}), 400
         
+        # 直接把上传流交给ASR服务，不在这里整体读入内存
         audio_file = request.files['audio']
-        audio_data = audio_file.read()
         
-        # 运行异步ASR识别
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        try:
-            result = loop.run_until_complete(
-                asr_service.recognize_speech(
-                    audio_data=audio_data,
-                    engine=engine,
-                    language=language,
-                    api_key=api_key
-                )
+        # 提交到后台事件循环运行异步ASR识别
+        result = async_runner.run(
+            asr_service.recognize_speech(
+                audio_data=audio_file.stream,
+                engine=engine,
+                language=language,
+                api_key=api_key,
+                filename=audio_file.filename or 'audio.wav',
+                content_type=audio_file.mimetype or 'audio/wav'
             )
-            
-            logger.info(f"ASR processed: engine: {engine}, language: {language}")
-            
-            return jsonify({
-                'text': result,
-                'engine': engine,
-                'language': language,
-                'timestamp': datetime.now().isoformat()
-            })
-            
-        finally:
-            loop.close()
+        )
+        
+        logger.info(f"ASR processed: engine: {engine}, language: {language}")
+        
+        return jsonify({
+            'text': result,
+            'engine': engine,
+            'language': language,
+            'timestamp': datetime.now().isoformat()
+        })
             
     except Exception as e:
         logger.error(f"ASR error: {str(e)}")
         return jsonify({'error': f'语音识别失败: {str(e)}'}), 500
 
+def asr_stream(ws):
+    """流式语音识别 WebSocket
+
+    协议：客户端先发送一条 JSON 配置
+    {engine, language, api_key, sample_rate, partial_interval}（partial_interval
+    省略时只有本地引擎推送中间结果），之后持续发送
+    16bit 单声道 PCM 二进制帧，说完后可发送 {"type": "end"}。服务端先回
+    {"type": "ready"}，随后推送 speech_start / partial / final / error 事件。
+    """
+    try:
+        config = json.loads(ws.receive(timeout=10) or '')
+        engine = config.get('engine', 'whisper')
+        language = config.get('language', 'zh-CN')
+        api_key = config.get('api_key', '')
+        sample_rate = int(config.get('sample_rate', 16000))
+        partial_interval = float(config['partial_interval']) if config.get('partial_interval') is not None else None
+    except (TypeError, ValueError, AttributeError):
+        ws.send(json.dumps({'type': 'error', 'error': '第一条消息应为JSON配置'}, ensure_ascii=False))
+        return
+    
+    validation = asr_service.validate_config(engine=engine, language=language, api_key=api_key)
+    if validation['valid'] and engine not in asr_service.streaming_engines:
+        validation['errors'].append(f"引擎 {engine} 不支持流式识别")
+    if validation['errors']:
+        ws.send(json.dumps({'type': 'error', 'error': f"配置错误: {', '.join(validation['errors'])}"},
+                           ensure_ascii=False))
+        return
+    
+    # 收到的音频帧投递到后台事件循环中的队列，None 表示输入结束
+    frames = async_runner.call(asyncio.Queue)
+    
+    async def receive_frames():
+        while True:
+            chunk = await frames.get()
+            if chunk is None:
+                return
+            yield chunk
+    
+    def read_frames():
+        try:
+            while True:
+                message = ws.receive()
+                if message is None:
+                    break
+                if isinstance(message, str):
+                    if json.loads(message).get('type') == 'end':
+                        break
+                    continue
+                async_runner.call_soon(frames.put_nowait, message)
+        except Exception as e:
+            logger.info(f"ASR stream receive stopped: {str(e)}")
+        finally:
+            async_runner.call_soon(frames.put_nowait, None)
+    
+    threading.Thread(target=read_frames, name='asr-stream-reader', daemon=True).start()
+    ws.send(json.dumps({'type': 'ready'}))
+    
+    try:
+        for event in async_runner.iterate(asr_service.recognize_stream(
+            receive_frames(),
+            engine=engine,
+            language=language,
+            api_key=api_key,
+            sample_rate=sample_rate,
+            partial_interval=partial_interval
+        )):
+            ws.send(json.dumps(event, ensure_ascii=False))
+        logger.info(f"ASR stream finished: engine: {engine}, language: {language}")
+    except Exception as e:
+        logger.error(f"ASR stream error: {str(e)}")
+        try:
+            ws.send(json.dumps({'type': 'error', 'error': f'语音识别失败: {str(e)}'}, ensure_ascii=False))
+        except Exception:
+            pass
+
+if Sock is not None:
+    Sock(app).route('/ws/asr')(asr_stream)
+else:
+    logger.warning("未安装 flask-sock，流式ASR接口 /ws/asr 不可用")
+
 @app.route('/api/services/info')
 def services_info():
     """获取服务信息"""
@@ -318,6 +685,7 @@ def services_info():
         },
         'asr': {
             'engines': asr_service.get_supported_engines(),
+            'streaming_engines': asr_service.streaming_engines if Sock is not None else [],
             'languages': asr_service.get_supported_languages()
         }
     })
@@ -336,14 +704,35 @@ def status():
         }
     })
 
+@app.route('/api/metrics')
+def metrics():
+    """服务运行指标"""
+    return jsonify({
+        'timestamp': datetime.now().isoformat(),
+        'llm': llm_service.get_metrics(),
+        'tts': tts_service.get_metrics(),
+        'tts_warmup': tts_warmup.get_metrics() if tts_warmup else None,
+        'asr': asr_service.get_metrics(),
+        'async': async_runner.get_metrics(),
+        'usage': usage_tracker.get_metrics()
+    })
+
 @app.route('/api/history', methods=['GET'])
 def get_history():
-    """获取聊天历史"""
+    """获取聊天历史
+
+    带 conversation_id 时返回该会话的消息，否则返回最近的会话列表。
+    """
     try:
-        # 这里可以从数据库或文件中读取历史记录
-        # 目前返回空列表，实际历史记录在前端管理
+        conversation_id = request.args.get('conversation_id')
+        if conversation_id:
+            return jsonify({
+                'conversation_id': conversation_id,
+                'history': history_store.get_messages(conversation_id, with_time=True),
+                'timestamp': datetime.now().isoformat()
+            })
         return jsonify({
-            'history': [],
+            'conversations': history_store.list_conversations(int(request.args.get('limit', 50))),
             'timestamp': datetime.now().isoformat()
         })
     except Exception as e:
@@ -352,15 +741,17 @@ def get_history():
 
 @app.route('/api/history', methods=['POST'])
 def save_history():
-    """保存聊天历史"""
+    """上传一个会话的完整历史（覆盖服务端已有记录）"""
     try:
         data = request.json
-        history = data.get('history', [])
+        conversation_id = data.get('conversation_id')
+        if not conversation_id:
+            return jsonify({'error': '缺少 conversation_id'}), 400
+        history = data.get('messages', data.get('history', []))
         
-        # 这里可以将历史记录保存到数据库或文件
-        # 目前只返回成功状态
+        history_store.replace_messages(conversation_id, history, title=data.get('title'))
         
-        logger.info(f"History saved: {len(history)} messages")
+        logger.info(f"History saved: {conversation_id}, {len(history)} messages")
         
         return jsonify({
             'success': True,
@@ -372,11 +763,15 @@ def save_history():
 
 @app.route('/api/history', methods=['DELETE'])
 def clear_history():
-    """清空聊天历史"""
+    """删除一个会话（带 conversation_id）或清空全部聊天历史"""
     try:
-        # 这里可以清空数据库或文件中的历史记录
+        conversation_id = request.args.get('conversation_id')
+        if conversation_id:
+            history_store.delete_conversation(conversation_id)
+        else:
+            history_store.clear()
         
-        logger.info("History cleared")
+        logger.info(f"History cleared: {conversation_id or 'all'}")
         
         return jsonify({
             'success': True,
@@ -388,22 +783,17 @@ def clear_history():
 
 @app.route('/api/live2d_models')
 def get_live2d_models():
-    """获取所有可用的Live2D模型"""
+    """获取所有可用的Live2D模型
+
+    列表来自内存中的模型索引（后台按修改时间刷新），附带 ETag；
+    客户端缓存有效时只返回 304。
+    """
     try:
-        models_dir = os.path.join(app.static_folder, 'live2d_models')
-        models = []
-        for name in os.listdir(models_dir):
-            model_path = os.path.join(models_dir, name)
-            if os.path.isdir(model_path):
-                # 查找主模型json文件
-                for file in os.listdir(model_path):
-                    if file.endswith('.model3.json'):
-                        models.append({
-                            'name': name,
-                            'json': f'/static/live2d_models/{name}/{file}'
-                        })
-        
-        return jsonify(models)
+        payload, etag = live2d_catalog.get()
+        cache_headers = {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'}
+        if etag in request.if_none_match:
+            return Response(status=304, headers=cache_headers)
+        return Response(payload, mimetype='application/json', headers=cache_headers)
         
     except Exception as e:
         logger.error(f"Get Live2D models error: {str(e)}")
@@ -449,18 +839,37 @@ def parent_dashboard():
         return redirect(url_for('parent_login'))
     time_limit = get_time_limit()
     sensitive_words = get_sensitive_words()
-    return render_template('parent_dashboard.html', time_limit=time_limit, sensitive_words=sensitive_words)
+    used_minutes = round(get_today_used_minutes(), 1)
+    return render_template('parent_dashboard.html', time_limit=time_limit, sensitive_words=sensitive_words,
+                           used_minutes=used_minutes)
 
 @app.route('/sensitive_log')
 def sensitive_log():
     if not session.get('parent_mode'):
         return redirect(url_for('parent_login'))
+    summary = sensitive_log_store.get_summary()
+    return render_template('sensitive_log.html', summary=summary)
+
+@app.route('/api/sensitive_log')
+def sensitive_log_api():
+    """分页获取敏感词触发记录"""
+    if not session.get('parent_mode'):
+        return jsonify({'error': '需要家长模式登录'}), 401
     try:
-        with open('sensitive_log.json', 'r', encoding='utf-8') as f:
-            log_data = json.load(f)
-    except Exception:
-        log_data = {}
-    return render_template('sensitive_log.html', log_data=log_data)
+        cursor = request.args.get('cursor')
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+        page = sensitive_log_store.query(
+            date=request.args.get('date') or None,
+            word=request.args.get('word') or None,
+            cursor=int(cursor) if cursor else None,
+            limit=limit
+        )
+        return jsonify(page)
+    except ValueError:
+        return jsonify({'error': '参数错误'}), 400
+    except Exception as e:
+        logger.error(f"Sensitive log query error: {str(e)}")
+        return jsonify({'error': f'获取敏感词记录失败: {str(e)}'}), 500
 
 @app.errorhandler(404)
 def not_found(error):
@@ -469,10 +878,3 @@ def not_found(error):
 @app.errorhandler(500)
 def internal_error(error):
     return jsonify({'error': '服务器内部错误'}), 500
-
-if __name__ == '__main__':
-    print("🚀 AI语音助手启动中...")
-    print("📝 访问地址: http://127.0.0.1:5000")
-    print("⚙️  请在设置中配置API Key")
-    
-    app.run(host='127.0.0.1', port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,23 @@
+"""开发服务器启动入口: python server.py
+
+本地ASR工作进程以 spawn 方式启动，会重新执行主模块；主模块因此只是这个
+不做任何初始化的小入口，应用和服务都在 __main__ 分支里从 app 模块导入，
+工作进程不会再创建一遍。
+"""
+import os
+
+def main():
+    from app import app, start_background_services
+
+    print("🚀 AI语音助手启动中...")
+    print("📝 访问地址: http://127.0.0.1:5000")
+    print("⚙️  请在设置中配置API Key")
+
+    # debug 模式下重载器的监控进程不处理请求，只在子进程中预热和加载模型
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_services()
+
+    app.run(host='127.0.0.1', port=5000, debug=True)
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,29 @@ AI语音助手服务模块
 """
 
 from .llm_service import LLMService
+from .async_llm import AsyncLLMService
+from .llm_cache import LLMResponseCache
+from .context_window import ContextManager
+from .provider_router import ProviderRouter
 from .tts_service import TTSService
 from .asr_service import ASRService
+from .sensitive_filter import SensitiveFilter
+from .event_log import SensitiveEventLog
+from .history_store import ChatHistoryStore
+from .http_session import ProviderSessionPool, MultipartBody
+from .async_runner import AsyncRunner
+from .tts_cache import TTSCache
+from .tts_pipeline import TTSPipeline, SentenceSplitter, split_sentences
+from .local_asr import LocalASRPool
+from .streaming_asr import EnergyVAD, pcm_to_wav
+from .live2d_catalog import Live2DCatalog
+from .asset_pipeline import AssetPipeline
+from .text_cleaner import TextCleaner, clean_tts_text
+from .tts_warmup import TTSWarmup
+from .usage_tracker import UsageTracker
 
-__all__ = ['LLMService', 'TTSService', 'ASRService']
+__all__ = ['LLMService', 'AsyncLLMService', 'LLMResponseCache', 'ContextManager', 'ProviderRouter', 'TTSService', 'ASRService', 'SensitiveFilter', 'SensitiveEventLog', 'ChatHistoryStore', 'ProviderSessionPool', 'MultipartBody', 'AsyncRunner',
+           'TTSCache', 'TTSPipeline', 'SentenceSplitter', 'split_sentences', 'LocalASRPool',
+           'EnergyVAD', 'pcm_to_wav', 'Live2DCatalog',
+           'AssetPipeline', 'TextCleaner', 'clean_tts_text',
+           'TTSWarmup', 'UsageTracker']
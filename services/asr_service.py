@@ -1,16 +1,35 @@
+import asyncio
+import functools
+import io
 import logging
-from typing import Dict, Any, List
+import threading
+import time
+from typing import Dict, Any, AsyncIterator, List, BinaryIO, Optional, Union
+
+from .http_session import ProviderSessionPool, MultipartBody
+from .local_asr import LocalASRPool
+from .streaming_asr import EnergyVAD, pcm_to_wav
 
 logger = logging.getLogger(__name__)
 
 class ASRService:
     """语音识别服务"""
     
-    def __init__(self):
+    def __init__(self, session_pool: Optional[ProviderSessionPool] = None,
+                 local_pool: Optional[LocalASRPool] = None):
+        self.session_pool = session_pool or ProviderSessionPool()
+        self.local_pool = local_pool
+        self._stage_timings: Dict[str, Dict[str, Dict[str, float]]] = {}
+        self._metrics_lock = threading.Lock()
         self.supported_engines = {
             'browser': self._browser_asr,
             'whisper': self._whisper_asr
         }
+        # 可对整段音频识别的引擎，流式识别按VAD切句后逐句调用
+        self.streaming_engines = ['whisper']
+        if local_pool is not None:
+            self.supported_engines['local'] = self._local_asr
+            self.streaming_engines.append('local')
         
         self.supported_languages = {
             'zh-CN': '中文',
@@ -27,14 +46,14 @@ class ASRService:
         """获取支持的语言列表"""
         return self.supported_languages
     
-    async def recognize_speech(self, audio_data: bytes, engine: str = 'browser',
+    async def recognize_speech(self, audio_data: Union[bytes, BinaryIO], engine: str = 'browser',
                              language: str = 'zh-CN', api_key: str = '',
                              **kwargs) -> str:
         """
         识别语音
         
         Args:
-            audio_data: 音频数据
+            audio_data: 音频数据（字节或可读的二进制流）
             engine: 识别引擎
             language: 语言代码
             api_key: API密钥（Whisper需要）
@@ -53,48 +72,225 @@ class ASRService:
             logger.error(f"ASR识别失败 [{engine}]: {str(e)}")
             raise
     
-    async def _browser_asr(self, audio_data: bytes, language: str, 
+    async def recognize_stream(self, frames: AsyncIterator[bytes], engine: str = 'whisper',
+                               language: str = 'zh-CN', api_key: str = '',
+                               sample_rate: int = 16000, partial_interval: Optional[float] = None,
+                               end_silence_ms: int = 600, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式识别
+
+        边接收音频边做VAD：说话过程中每累计 partial_interval 秒新语音识别一次
+        当前整句作为中间结果，检测到句尾静音后识别整句作为最终结果。
+        每句都通过 recognize_speech 交给指定引擎识别。
+        
+        Args:
+            frames: 16bit 单声道小端 PCM 音频块的异步迭代器
+            engine: 识别引擎（见 streaming_engines）
+            sample_rate: 采样率
+            partial_interval: 中间结果间隔（秒），0 表示不产出中间结果；默认只有
+                本地引擎产出中间结果 (1 秒)。每次中间结果都要重新识别当前整句，
+                按时长计费的远程引擎费用会随句长平方增长，需要时显式开启
+            end_silence_ms: 判定句子结束的静音时长
+            
+        Yields:
+            {'type': 'speech_start', 'utterance': 序号}
+            {'type': 'partial', 'utterance': 序号, 'text': 中间结果}
+            {'type': 'final', 'utterance': 序号, 'text': 最终结果}
+            {'type': 'error', 'utterance': 序号, 'error': 错误信息} —— 单句识别失败
+        """
+        if engine not in self.streaming_engines:
+            raise ValueError(f"不支持流式识别的ASR引擎: {engine}")
+        
+        if partial_interval is None:
+            partial_interval = 1.0 if engine == 'local' else 0
+        vad = EnergyVAD(sample_rate=sample_rate, end_silence_ms=end_silence_ms)
+        partial_bytes = int(partial_interval * sample_rate) * 2
+        events: asyncio.Queue = asyncio.Queue()
+        done = object()
+        tasks = set()
+        state = {'open': None, 'count': 0, 'last_final': None,
+                 'partial_task': None, 'partial_at': 0}
+        
+        async def recognize(pcm: bytes) -> str:
+            return await self.recognize_speech(
+                pcm_to_wav(pcm, sample_rate), engine, language, api_key,
+                filename='utterance.wav', content_type='audio/wav', **kwargs
+            )
+        
+        async def emit_partial(index: int, pcm: bytes):
+            try:
+                text = await recognize(pcm)
+            except Exception as e:
+                logger.warning(f"流式ASR中间结果识别失败 [{index}]: {str(e)}")
+                return
+            # 句子已结束则丢弃，最终结果会覆盖它
+            if text and state['open'] == index:
+                await events.put({'type': 'partial', 'utterance': index, 'text': text})
+        
+        async def emit_final(index: int, pcm: bytes, previous: Optional[asyncio.Task]):
+            ended = time.perf_counter()
+            try:
+                event = {'type': 'final', 'utterance': index, 'text': await recognize(pcm)}
+            except Exception as e:
+                event = {'type': 'error', 'utterance': index, 'error': str(e)}
+            self._record_timings('stream', {'final_latency': time.perf_counter() - ended})
+            # 最终结果按句子顺序送出
+            if previous is not None:
+                await previous
+            await events.put(event)
+        
+        def spawn(coro) -> asyncio.Task:
+            task = asyncio.ensure_future(coro)
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            return task
+        
+        def finish_utterance(pcm: bytes):
+            index, state['open'] = state['open'], None
+            state['last_final'] = spawn(emit_final(index, pcm, state['last_final']))
+        
+        async def consume():
+            try:
+                async for chunk in frames:
+                    for kind, pcm in vad.feed(chunk):
+                        if kind == 'start':
+                            state['open'] = state['count']
+                            state['count'] += 1
+                            state['partial_at'] = 0
+                            await events.put({'type': 'speech_start', 'utterance': state['open']})
+                        else:
+                            finish_utterance(pcm)
+                    
+                    partial_task = state['partial_task']
+                    if (partial_bytes and vad.in_speech
+                            and (partial_task is None or partial_task.done())):
+                        audio = vad.current_audio()
+                        if len(audio) - state['partial_at'] >= partial_bytes:
+                            state['partial_at'] = len(audio)
+                            state['partial_task'] = spawn(emit_partial(state['open'], audio))
+                
+                rest = vad.flush()
+                if rest:
+                    finish_utterance(rest)
+                while tasks:
+                    await asyncio.gather(*list(tasks))
+                await events.put(done)
+            except Exception as e:
+                await events.put(e)
+        
+        consumer = asyncio.ensure_future(consume())
+        try:
+            while True:
+                item = await events.get()
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            consumer.cancel()
+            for task in list(tasks):
+                task.cancel()
+    
+    async def _browser_asr(self, audio_data: Union[bytes, BinaryIO], language: str, 
                           api_key: str, **kwargs) -> str:
         """浏览器内置ASR (实际在前端处理)"""
         # 浏览器ASR在前端处理，这里只是占位
         return "浏览器ASR在前端处理"
     
-    async def _whisper_asr(self, audio_data: bytes, language: str,
-                          api_key: str, **kwargs) -> str:
-        """Whisper ASR"""
-        # 实现Whisper API调用
-        import requests
-        import tempfile
-        import os
-        
-        # 保存音频到临时文件
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_file:
-            temp_file.write(audio_data)
-            temp_path = temp_file.name
+    async def _whisper_asr(self, audio_data: Union[bytes, BinaryIO], language: str,
+                          api_key: str, filename: str = 'audio.wav',
+                          content_type: str = 'audio/wav', **kwargs) -> str:
+        """Whisper ASR
+
+        音频流直接作为 multipart 请求体的一部分按块上传，不写临时文件；
+        通过连接池复用到 api.openai.com 的连接。
+        """
+        timings = {}
+        start = time.perf_counter()
         
-        try:
-            headers = {'Authorization': f'Bearer {api_key}'}
-            files = {'file': open(temp_path, 'rb')}
-            data = {
+        stream = io.BytesIO(audio_data) if isinstance(audio_data, (bytes, bytearray)) else audio_data
+        body = MultipartBody(
+            fields={
                 'model': 'whisper-1',
                 'language': language.split('-')[0]  # 转换为ISO语言代码
+            },
+            file_field='file',
+            filename=filename,
+            fileobj=stream,
+            content_type=content_type
+        )
+        headers = {
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': body.content_type
+        }
+        timings['prepare'] = time.perf_counter() - start
+        
+        # requests 是阻塞调用，放到线程池执行，避免阻塞共享的事件循环
+        start = time.perf_counter()
+        response = await asyncio.get_running_loop().run_in_executor(None, functools.partial(
+            self.session_pool.post,
+            'openai',
+            'https://api.openai.com/v1/audio/transcriptions',
+            headers=headers,
+            data=body
+        ))
+        timings['upload'] = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        response.raise_for_status()
+        result = response.json()
+        timings['parse'] = time.perf_counter() - start
+        
+        self._record_timings('whisper', timings)
+        logger.info(f"Whisper ASR耗时: " + ', '.join(f"{k}={v * 1000:.1f}ms" for k, v in timings.items())
+                    + f", 上传 {len(body)} bytes")
+        return result.get('text', '')
+    
+    async def _local_asr(self, audio_data: Union[bytes, BinaryIO], language: str,
+                         api_key: str, **kwargs) -> str:
+        """本地离线ASR (faster-whisper 模型池)"""
+        timings = {}
+        start = time.perf_counter()
+        audio = bytes(audio_data) if isinstance(audio_data, (bytes, bytearray)) else audio_data.read()
+        timings['prepare'] = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        text = await self.local_pool.transcribe(audio, language.split('-')[0])
+        timings['decode'] = time.perf_counter() - start
+        
+        self._record_timings('local', timings)
+        logger.info(f"本地ASR耗时: " + ', '.join(f"{k}={v * 1000:.1f}ms" for k, v in timings.items()))
+        return text
+    
+    def _record_timings(self, engine: str, timings: Dict[str, float]):
+        """累计各阶段耗时"""
+        with self._metrics_lock:
+            stages = self._stage_timings.setdefault(engine, {})
+            for stage, seconds in timings.items():
+                stat = stages.setdefault(stage, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+                stat['count'] += 1
+                stat['total_ms'] += seconds * 1000
+                stat['max_ms'] = max(stat['max_ms'], seconds * 1000)
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """获取ASR各阶段耗时统计"""
+        with self._metrics_lock:
+            stages = {
+                engine: {
+                    stage: {
+                        'count': stat['count'],
+                        'avg_ms': round(stat['total_ms'] / stat['count'], 1),
+                        'max_ms': round(stat['max_ms'], 1)
+                    }
+                    for stage, stat in stages.items()
+                }
+                for engine, stages in self._stage_timings.items()
             }
-            
-            response = requests.post(
-                'https://api.openai.com/v1/audio/transcriptions',
-                headers=headers,
-                files=files,
-                data=data,
-                timeout=30
-            )
-            
-            response.raise_for_status()
-            result = response.json()
-            return result.get('text', '')
-            
-        finally:
-            if os.path.exists(temp_path):
-                os.unlink(temp_path)
+        return {
+            'stages': stages,
+            'local_pool': self.local_pool.get_metrics() if self.local_pool else None
+        }
     
     def validate_config(self, engine: str, language: str, 
                        api_key: str) -> Dict[str, Any]:
@@ -112,6 +308,10 @@ class ASRService:
         if language not in self.supported_languages:
             validation_result['warnings'].append(f"语言 {language} 可能不被支持")
         
+        if engine == 'local' and not LocalASRPool.available():
+            validation_result['valid'] = False
+            validation_result['errors'].append("本地ASR引擎需要安装 faster-whisper")
+        
         if engine == 'whisper' and not api_key:
             validation_result['valid'] = False
             validation_result['errors'].append("Whisper引擎需要API Key")
@@ -0,0 +1,170 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # 可选依赖，未安装时只生成 gzip 版本
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+class AssetPipeline:
+    """静态资源指纹化与预压缩
+
+    把 static 下指定目录的 JS/CSS 复制到 dist 目录，文件名带内容哈希
+    （如 pixi.min.3f2a9c1b7e4d.js），并预先生成 .gz（以及安装了 brotli 时的
+    .br）版本。文件名随内容变化，因此可以按 immutable 长期缓存；
+    manifest.json 记录逻辑路径到指纹文件名的映射和源文件的大小/修改时间，
+    源文件未变化时启动不会重新构建。
+    """
+
+    MANIFEST = 'manifest.json'
+    TEMP_SUFFIX = '.tmp'
+    ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+    def __init__(self, static_dir: str, dist_name: str = 'dist',
+                 sources: Tuple[str, ...] = ('live2d_core', 'js', 'css'),
+                 extensions: Tuple[str, ...] = ('.js', '.css')):
+        """
+        Args:
+            static_dir: Flask 的 static 目录
+            dist_name: 输出目录名（位于 static_dir 下）
+            sources: 需要处理的子目录
+            extensions: 需要处理的文件扩展名
+        """
+        self.static_dir = static_dir
+        self.dist_name = dist_name
+        self.dist_dir = os.path.abspath(os.path.join(static_dir, dist_name))
+        self.sources = sources
+        self.extensions = extensions
+        self._files: Dict[str, str] = {}
+
+    def ensure_built(self) -> bool:
+        """源文件有变化时重新构建，返回是否构建"""
+        manifest = self._read_manifest()
+        signature = self._source_signature()
+        if manifest.get('sources') == signature and all(
+            os.path.exists(os.path.join(self.dist_dir, name)) for name in manifest.get('files', {}).values()
+        ):
+            self._files = manifest['files']
+            return False
+        self.build(signature)
+        return True
+
+    def build(self, signature: Optional[Dict[str, List[int]]] = None):
+        """生成指纹文件和压缩版本，清理过期文件"""
+        signature = signature or self._source_signature()
+        os.makedirs(self.dist_dir, exist_ok=True)
+
+        files = {}
+        raw_bytes = compressed_bytes = 0
+        for logical in signature:
+            with open(os.path.join(self.static_dir, logical), 'rb') as f:
+                data = f.read()
+            stem, ext = os.path.splitext(logical)
+            hashed = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+            target = os.path.join(self.dist_dir, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if not os.path.exists(target):
+                self._write(target, data)
+            if not os.path.exists(target + '.gz'):
+                # mtime=0 使相同内容的 gzip 输出逐字节一致
+                self._write(target + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None and not os.path.exists(target + '.br'):
+                self._write(target + '.br', brotli.compress(data, quality=11))
+            files[logical] = hashed
+            raw_bytes += len(data)
+            compressed_bytes += os.path.getsize(target + ('.br' if brotli is not None else '.gz'))
+
+        self._prune(files)
+        self._write(os.path.join(self.dist_dir, self.MANIFEST),
+                    json.dumps({'files': files, 'sources': signature}, ensure_ascii=False, indent=2).encode('utf-8'))
+        self._files = files
+        logger.info(f"静态资源已构建: {len(files)} 个文件, {raw_bytes} -> {compressed_bytes} bytes")
+
+    def url(self, logical: str) -> str:
+        """模板中使用的资源 URL；未构建的文件退回原始路径"""
+        logical = logical.lstrip('/')
+        hashed = self._files.get(logical)
+        if hashed is None:
+            return f'/static/{logical}'
+        return f'/static/{self.dist_name}/{hashed}'
+
+    def resolve(self, filename: str, accept_encoding: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        按客户端支持的编码选择要发送的文件
+
+        Returns:
+            (文件路径, Content-Encoding)；文件不存在时返回 (None, None)
+        """
+        path = os.path.normpath(os.path.join(self.dist_dir, filename))
+        if not path.startswith(self.dist_dir + os.sep) or not os.path.isfile(path):
+            return None, None
+        accepted = {part.split(';')[0].strip() for part in accept_encoding.lower().split(',')}
+        for encoding, suffix in self.ENCODINGS:
+            if encoding in accepted and os.path.isfile(path + suffix):
+                return path + suffix, encoding
+        return path, None
+
+    def _source_signature(self) -> Dict[str, List[int]]:
+        """{逻辑路径: [大小, 修改时间]}"""
+        signature = {}
+        for source in self.sources:
+            root = os.path.join(self.static_dir, source)
+            for dirpath, _, names in os.walk(root):
+                for name in sorted(names):
+                    if not name.endswith(self.extensions):
+                        continue
+                    path = os.path.join(dirpath, name)
+                    stat = os.stat(path)
+                    logical = os.path.relpath(path, self.static_dir).replace(os.sep, '/')
+                    signature[logical] = [stat.st_size, stat.st_mtime_ns]
+        return dict(sorted(signature.items()))
+
+    def _read_manifest(self) -> Dict:
+        try:
+            with open(os.path.join(self.dist_dir, self.MANIFEST), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _prune(self, files: Dict[str, str]):
+        """删除不再被引用的旧指纹文件"""
+        keep = {self.MANIFEST}
+        for hashed in files.values():
+            keep.update([hashed, hashed + '.gz', hashed + '.br'])
+        for dirpath, _, names in os.walk(self.dist_dir):
+            for name in names:
+                if name.endswith(self.TEMP_SUFFIX):
+                    # 可能是其他进程正在写入的临时文件
+                    continue
+                path = os.path.join(dirpath, name)
+                if os.path.relpath(path, self.dist_dir).replace(os.sep, '/') not in keep:
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass  # 已被其他进程清理
+
+    @classmethod
+    def _write(cls, path: str, data: bytes):
+        """原子写入：多个工作进程同时构建时各自写独立的临时文件再替换"""
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), prefix='.', suffix=cls.TEMP_SUFFIX,
+                                         delete=False) as f:
+            temp_path = f.name
+            f.write(data)
+        try:
+            os.replace(temp_path, path)
+        except OSError:
+            os.unlink(temp_path)
+            raise
+
+if __name__ == '__main__':
+    # 手动构建: python -m services.asset_pipeline [static目录]
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    AssetPipeline(sys.argv[1] if len(sys.argv) > 1 else 'static').build()
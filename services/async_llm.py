@@ -0,0 +1,292 @@
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+try:
+    import aiohttp
+except ImportError:  # 可选依赖，未安装时只能使用同步的 LLMService
+    aiohttp = None
+
+from .context_window import ContextManager
+from .llm_cache import LLMResponseCache
+from .llm_service import LLMService
+
+logger = logging.getLogger(__name__)
+
+class AsyncLLMService(LLMService):
+    """基于 aiohttp 的异步LLM服务
+
+    所有上游请求都在一个事件循环（AsyncRunner）中发出，单进程即可同时保持
+    上百个调用；temperature 为 0 的相同请求（提供商、模型、消息、API Key
+    均相同）在进行中时合并为一次上游调用，结果共享给所有等待方；流式请求
+    同样合并，后加入的等待方先收到已到达的片段，再随上游继续接收。
+
+    同步的 call_llm / stream_llm 接口保持不变（提交到 runner 执行），
+    已在事件循环中的调用方可直接使用 acall_llm / astream_llm。
+    """
+
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+
+    def __init__(self, runner, pool_size: int = 100, connect_timeout: float = 5,
+                 read_timeout: float = 30, max_retries: int = 2,
+                 backoff_factor: float = 0.5, cache: Optional[LLMResponseCache] = None,
+                 context: Optional[ContextManager] = None):
+        """
+        Args:
+            runner: 运行上游请求的 AsyncRunner（建议单独使用一个，避免占用TTS/ASR的并发名额）
+            pool_size: 每个提供商主机的最大连接数
+            connect_timeout: 连接超时（秒）
+            read_timeout: 两次读取之间的最长等待（秒）
+            max_retries: 429/5xx/连接错误的最大重试次数
+            backoff_factor: 重试退避系数，第 n 次重试等待 backoff_factor * 2^(n-1) 秒
+            cache: 可选的回复缓存
+            context: 上下文裁剪器，默认按模型预算裁剪
+        """
+        if aiohttp is None:
+            raise RuntimeError("异步LLM服务需要安装 aiohttp")
+        super().__init__(cache=cache, context=context)
+        self.runner = runner
+        self.pool_size = pool_size
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+
+        self.async_providers = {
+            'deepseek': ('DeepSeek MaaS', self._deepseek_request),
+            'kimi': ('Kimi', self._kimi_request)
+        }
+        self._http: Optional['aiohttp.ClientSession'] = None
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._inflight_streams: Dict[str, '_SharedStream'] = {}
+        self._stats = {'requests': 0, 'upstream_calls': 0, 'coalesced': 0,
+                       'in_flight': 0, 'max_in_flight': 0}
+
+    def call_llm(self, provider: str, messages: List[Dict], model: str,
+                 temperature: float, api_key: str, **kwargs) -> str:
+        return self.runner.run(self.acall_llm(provider, messages, model, temperature, api_key, **kwargs))
+
+    def stream_llm(self, provider: str, messages: List[Dict], model: str,
+                   temperature: float, api_key: str, **kwargs) -> Iterator[str]:
+        return self.runner.iterate(self.astream_llm(provider, messages, model, temperature, api_key, **kwargs))
+
+    async def acall_llm(self, provider: str, messages: List[Dict], model: str,
+                        temperature: float, api_key: str, **kwargs) -> str:
+        """异步调用指定的LLM服务"""
+        self._check_call(provider, model, api_key)
+        self._stats['requests'] += 1
+
+        cached = self._cache_get(provider, messages, model, temperature)
+        if cached is not None:
+            return cached
+
+        if temperature != 0:
+            return await self._complete(provider, messages, model, temperature, api_key, **kwargs)
+
+        key = self._coalesce_key(provider, messages, model, api_key, **kwargs)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._complete(provider, messages, model, temperature, api_key, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self._stats['coalesced'] += 1
+            logger.info(f"合并相同的LLM请求: provider={provider}, model={model}")
+        # shield：某个等待方取消（如客户端断开）不影响其他等待方
+        return await asyncio.shield(task)
+
+    async def astream_llm(self, provider: str, messages: List[Dict], model: str,
+                          temperature: float, api_key: str, **kwargs) -> AsyncIterator[str]:
+        """异步流式调用指定的LLM服务，逐段产出回复文本"""
+        self._check_call(provider, model, api_key)
+        self._stats['requests'] += 1
+
+        cached = self._cache_get(provider, messages, model, temperature)
+        if cached is not None:
+            yield cached
+            return
+
+        if temperature != 0:
+            async for content in self._stream(provider, messages, model, temperature, api_key, **kwargs):
+                yield content
+            return
+
+        key = self._coalesce_key(provider, messages, model, api_key, **kwargs)
+        shared = self._inflight_streams.get(key)
+        if shared is None:
+            shared = _SharedStream()
+            self._inflight_streams[key] = shared
+            # 上游流在独立任务中读取，某个等待方断开不影响其他等待方
+            asyncio.ensure_future(self._pump(key, shared, provider, messages, model,
+                                             temperature, api_key, **kwargs))
+        else:
+            self._stats['coalesced'] += 1
+            logger.info(f"合并相同的LLM流式请求: provider={provider}, model={model}")
+        async for content in shared.read():
+            yield content
+
+    async def _pump(self, key: str, shared: '_SharedStream', provider: str, messages: List[Dict],
+                    model: str, temperature: float, api_key: str, **kwargs):
+        """把一次上游流式调用的片段转发给所有等待方"""
+        try:
+            async for content in self._stream(provider, messages, model, temperature, api_key, **kwargs):
+                shared.push(content)
+            shared.finish()
+        except Exception as e:
+            shared.finish(e)
+        finally:
+            self._inflight_streams.pop(key, None)
+            if not shared.done:
+                shared.finish(RuntimeError("LLM流式请求已取消"))
+
+    async def _stream(self, provider: str, messages: List[Dict], model: str,
+                      temperature: float, api_key: str, **kwargs) -> AsyncIterator[str]:
+        """一次上游流式调用，完整结束后写入缓存"""
+        label, build = self.async_providers[provider]
+        trimmed = self._fit_context(provider, model, messages, **kwargs)
+        parts = []
+        self._enter()
+        try:
+            response = await self._post(label, build(trimmed, model, temperature, api_key, stream=True, **kwargs))
+            async with response:
+                async for line in response.content:
+                    content = self._parse_sse_line(line)
+                    if content is None:
+                        break
+                    if content:
+                        parts.append(content)
+                        yield content
+        except Exception as e:
+            raise self._translate_error(provider, e)
+        finally:
+            self._leave()
+        self._cache_put(provider, messages, model, temperature, ''.join(parts))
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """获取LLM调用统计"""
+        return {
+            'async': dict(self._stats),
+            'cache': self.cache.get_metrics() if self.cache else None,
+            'context': self.context.get_metrics()
+        }
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+
+    async def _complete(self, provider: str, messages: List[Dict], model: str,
+                        temperature: float, api_key: str, **kwargs) -> str:
+        label, build = self.async_providers[provider]
+        trimmed = self._fit_context(provider, model, messages, **kwargs)
+        self._enter()
+        try:
+            response = await self._post(label, build(trimmed, model, temperature, api_key, **kwargs))
+            async with response:
+                result = await response.json(content_type=None)
+            content = result['choices'][0]['message']['content']
+        except Exception as e:
+            raise self._translate_error(provider, e)
+        finally:
+            self._leave()
+        self._cache_put(provider, messages, model, temperature, content)
+        return content
+
+    async def _post(self, label: str, request_kwargs: Dict[str, Any]) -> 'aiohttp.ClientResponse':
+        """发送请求，对 429/5xx/连接错误按指数退避重试；返回状态正常的响应"""
+        request_kwargs = dict(request_kwargs)
+        if request_kwargs.pop('verify', True) is False:
+            request_kwargs['ssl'] = False
+        url = request_kwargs.pop('url')
+
+        attempt = 0
+        while True:
+            self._stats['upstream_calls'] += 1
+            try:
+                response = await self._session().post(url, **request_kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt >= self.max_retries:
+                    raise
+            else:
+                if response.status < 400:
+                    return response
+                if response.status not in self.RETRY_STATUS or attempt >= self.max_retries:
+                    await self._check_response_async(label, response)
+                response.release()
+            attempt += 1
+            await asyncio.sleep(self.backoff_factor * 2 ** (attempt - 1))
+
+    async def _check_response_async(self, label: str, response: 'aiohttp.ClientResponse'):
+        """记录详细的错误信息并抛出 ClientResponseError"""
+        text = await response.text()
+        try:
+            logger.error(f"{label} API错误详情: {json.loads(text)}")
+        except ValueError:
+            logger.error(f"{label} API错误: status={response.status}, text={text}")
+        response.release()
+        response.raise_for_status()
+
+    def _translate_error(self, provider: str, e: Exception) -> Exception:
+        if isinstance(e, aiohttp.ClientResponseError):
+            return self._translate_status(provider, e.status, e)
+        if isinstance(e, (aiohttp.ClientError, asyncio.TimeoutError)):
+            logger.error(f"LLM调用网络错误 [{provider}]: {str(e)}")
+            return ValueError(f"网络连接失败 [{provider}]: 请检查网络连接")
+        return super()._translate_error(provider, e)
+
+    def _session(self) -> 'aiohttp.ClientSession':
+        # 会话绑定事件循环，需在 runner 的循环中首次创建
+        if self._http is None or self._http.closed:
+            connector = aiohttp.TCPConnector(limit=0, limit_per_host=self.pool_size)
+            self._http = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._http
+
+    def _coalesce_key(self, provider: str, messages: List[Dict], model: str,
+                      api_key: str, **kwargs) -> str:
+        raw = json.dumps([provider, model, kwargs.get('max_tokens', 1000), messages],
+                         ensure_ascii=False, sort_keys=True)
+        # 按 API Key 区分，避免一个账户的调用结果被另一个（可能无效的）Key 共享
+        raw += hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _enter(self):
+        self._stats['in_flight'] += 1
+        self._stats['max_in_flight'] = max(self._stats['max_in_flight'], self._stats['in_flight'])
+
+    def _leave(self):
+        self._stats['in_flight'] -= 1
+
+class _SharedStream:
+    """一次上游流式调用的片段，供多个等待方各自从头读取（只在事件循环线程中使用）"""
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.done = False
+        self.error: Optional[Exception] = None
+        self._changed = asyncio.Event()
+
+    def push(self, content: str):
+        self.parts.append(content)
+        self._wake()
+
+    def finish(self, error: Optional[Exception] = None):
+        self.done = True
+        self.error = error
+        self._wake()
+
+    async def read(self) -> AsyncIterator[str]:
+        index = 0
+        while True:
+            while index < len(self.parts):
+                yield self.parts[index]
+                index += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+class AsyncRunner:
+    """后台常驻事件循环
+
+    Flask 的同步视图通过 submit()/run()/iterate() 把 TTSService、ASRService
+    的协程提交到同一个长期运行的事件循环，不再每个请求新建、关闭事件循环。
+    同时运行的协程数受 max_concurrency 限制，超出的在循环内排队等待；
+    iterate() 的流只在取下一项时占用名额。
+    """
+
+    def __init__(self, max_concurrency: int = 32, name: str = 'async-runner'):
+        self.max_concurrency = max_concurrency
+        self._loop = asyncio.new_event_loop()
+        # Python 3.10 之前 asyncio 的同步原语在创建时绑定事件循环，需在循环线程中创建
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {'queued': 0, 'running': 0, 'completed': 0, 'failed': 0, 'max_queued': 0,
+                       'streams': 0}
+
+        self._thread = threading.Thread(target=self._run_loop, name=name, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def submit(self, coro: Awaitable) -> Future:
+        """提交协程，返回线程安全的 concurrent.futures.Future"""
+        self._count_queued()
+        return asyncio.run_coroutine_threadsafe(self._guarded(coro), self._loop)
+
+    def run(self, coro: Awaitable, timeout: Optional[float] = None) -> Any:
+        """提交协程并阻塞等待结果"""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def iterate(self, agen: AsyncIterator, max_buffered: int = 16) -> Iterator:
+        """
+        在事件循环中运行异步生成器，同步逐项产出结果
+
+        生成器最多领先调用方 max_buffered 项，调用方读得慢（如客户端网速慢）时
+        生成器暂停，不会在内存中无限堆积。每取一项时占用一个并发名额，项与项之间（如等待上游数据、客户端读取）
+        不占名额，长时间的流不会挤占其他请求；调用方提前停止迭代（如客户端
+        断开）时，异步生成器会被关闭。
+        """
+        items: 'queue.Queue' = queue.Queue()
+        stopped = threading.Event()
+        done = object()
+        credits = self.call(asyncio.Semaphore, max_buffered)
+
+        async def consume():
+            try:
+                while True:
+                    await credits.acquire()
+                    if stopped.is_set():
+                        break
+                    async with self._semaphore:
+                        item = await agen.__anext__()
+                    items.put(item)
+            except StopAsyncIteration:
+                pass
+            except Exception as e:
+                items.put(e)
+            finally:
+                await agen.aclose()
+                with self._lock:
+                    self._stats['streams'] -= 1
+                items.put(done)
+
+        with self._lock:
+            self._stats['streams'] += 1
+        asyncio.run_coroutine_threadsafe(consume(), self._loop)
+        try:
+            while True:
+                item = items.get()
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                self._loop.call_soon_threadsafe(credits.release)
+                yield item
+        finally:
+            stopped.set()
+            # 唤醒等待名额的生成器，让它退出并关闭
+            self._loop.call_soon_threadsafe(credits.release)
+
+    def call(self, fn: Callable, *args) -> Any:
+        """在事件循环线程中调用 fn 并返回结果，用于创建绑定到该循环的 asyncio 对象（如 Queue）；
+        不能在事件循环线程中调用"""
+        future: Future = Future()
+
+        def invoke():
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+        self._loop.call_soon_threadsafe(invoke)
+        return future.result()
+
+    def call_soon(self, callback: Callable, *args):
+        """在事件循环线程中调用回调（如向 asyncio.Queue 投递数据）"""
+        self._loop.call_soon_threadsafe(callback, *args)
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """并发与排队统计"""
+        with self._lock:
+            return dict(self._stats, max_concurrency=self.max_concurrency)
+
+    def close(self, timeout: float = 5.0):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+
+    async def _guarded(self, coro: Awaitable) -> Any:
+        started = False
+        try:
+            async with self._semaphore:
+                started = True
+                with self._lock:
+                    self._stats['queued'] -= 1
+                    self._stats['running'] += 1
+                try:
+                    result = await coro
+                except BaseException:
+                    with self._lock:
+                        self._stats['failed'] += 1
+                    raise
+                finally:
+                    with self._lock:
+                        self._stats['running'] -= 1
+                with self._lock:
+                    self._stats['completed'] += 1
+                return result
+        finally:
+            if not started:
+                # 排队期间被取消
+                with self._lock:
+                    self._stats['queued'] -= 1
+                if asyncio.iscoroutine(coro):
+                    coro.close()
+
+    def _count_queued(self):
+        with self._lock:
+            self._stats['queued'] += 1
+            self._stats['max_queued'] = max(self._stats['max_queued'], self._stats['queued'])
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._ready.set()
+        logger.info(f"后台事件循环已启动: max_concurrency={self.max_concurrency}")
+        self._loop.run_forever()
@@ -0,0 +1,170 @@
+import hashlib
+import logging
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 中日韩字符（含全角标点），约 1 个 token 一个字
+_CJK = re.compile(r'[　-〿぀-ヿ一-鿿＀-￯]')
+# 摘要时截取每条消息的第一句
+_FIRST_SENTENCE = re.compile(r'^.*?(?:[。！？!?；;\n]|\.(?=\s)|$)', re.S)
+
+class ContextManager:
+    """按 token 预算裁剪对话上下文
+
+    估算每条消息的 token 数，保留全部 system 消息和尽可能多的最近轮次，
+    使请求不超过模型上下文窗口（扣除回复预留）。放不下的早期轮次压缩成
+    一条"此前对话摘要"（每条消息取第一句，抽取式，不额外调用LLM）。
+    摘要按消息前缀的链式哈希缓存，对话变长时只需在上次的摘要后追加。
+    """
+
+    MODEL_BUDGETS = {
+        'moonshot-v1-8k': 8 * 1024,
+        'moonshot-v1-32k': 32 * 1024,
+        'moonshot-v1-128k': 128 * 1024,
+        'DeepSeek-V3': 64 * 1024
+    }
+    PROVIDER_BUDGETS = {
+        'kimi': 8 * 1024,
+        'deepseek': 64 * 1024
+    }
+    MESSAGE_OVERHEAD = 4
+
+    def __init__(self, summary_max_tokens: int = 512, line_max_chars: int = 60,
+                 safety_margin: int = 256, max_cached_summaries: int = 256):
+        """
+        Args:
+            summary_max_tokens: 摘要的 token 上限，超出时丢弃摘要中最早的内容
+            line_max_chars: 摘要中每条消息最多保留的字符数
+            safety_margin: token 估算误差的预留量
+            max_cached_summaries: 缓存的摘要条数
+        """
+        self.summary_max_tokens = summary_max_tokens
+        self.line_max_chars = line_max_chars
+        self.safety_margin = safety_margin
+        self.max_cached_summaries = max_cached_summaries
+
+        self._lock = threading.Lock()
+        # 前缀链式哈希 -> 该前缀的摘要行
+        self._summaries: 'OrderedDict[str, Tuple[str, ...]]' = OrderedDict()
+        self._stats = {'requests': 0, 'trimmed': 0, 'dropped_messages': 0,
+                       'summary_cache_hits': 0}
+
+    @classmethod
+    def estimate_tokens(cls, text: Any) -> int:
+        """粗略估算 token 数：中日韩字符按 1 个，其余按 4 个字符 1 个"""
+        if not isinstance(text, str):
+            text = str(text)
+        cjk = len(_CJK.findall(text))
+        return cjk + (len(text) - cjk + 3) // 4
+
+    def budget_for(self, provider: str, model: str) -> int:
+        return self.MODEL_BUDGETS.get(model) or self.PROVIDER_BUDGETS.get(provider, 8 * 1024)
+
+    def fit(self, provider: str, model: str, messages: List[Dict],
+            max_tokens: int = 1000) -> List[Dict]:
+        """
+        裁剪消息列表使其符合模型的上下文预算
+
+        Returns:
+            未超预算时原样返回；否则返回 system 消息 + 摘要 + 最近轮次
+        """
+        with self._lock:
+            self._stats['requests'] += 1
+
+        budget = self.budget_for(provider, model) - max_tokens - self.safety_margin
+        costs = [self._message_tokens(m) for m in messages]
+        if sum(costs) <= budget:
+            return messages
+
+        system = [m for m in messages if m.get('role') == 'system']
+        dialog = [(m, c) for m, c in zip(messages, costs) if m.get('role') != 'system']
+        remaining = budget - sum(self._message_tokens(m) for m in system) - self.summary_max_tokens
+
+        # 从最新的消息往前保留，最后一条（当前提问）总是保留
+        keep = 0
+        for _, cost in reversed(dialog):
+            if keep and cost > remaining:
+                break
+            remaining -= cost
+            keep += 1
+        # 保留部分从用户消息开始，避免以孤立的助手回复开头
+        while keep > 1 and dialog[len(dialog) - keep][0].get('role') == 'assistant':
+            keep -= 1
+
+        dropped = [m for m, _ in dialog[:len(dialog) - keep]]
+        kept = [m for m, _ in dialog[len(dialog) - keep:]]
+        summary = self._summarize(dropped)
+
+        with self._lock:
+            self._stats['trimmed'] += 1
+            self._stats['dropped_messages'] += len(dropped)
+        logger.info(f"上下文裁剪: model={model}, 原 {len(messages)} 条, 摘要 {len(dropped)} 条, 保留 {len(kept)} 条")
+
+        result = list(system)
+        if summary:
+            result.append({'role': 'system', 'content': f"此前对话摘要：\n{summary}"})
+        return result + kept
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, cached_summaries=len(self._summaries))
+
+    def _summarize(self, dropped: List[Dict]) -> str:
+        """生成被裁掉消息的摘要，复用已缓存的最长前缀"""
+        digests = []
+        digest = b''
+        for message in dropped:
+            digest = hashlib.sha1(digest + self._message_bytes(message)).digest()
+            digests.append(digest.hex())
+
+        lines: Tuple[str, ...] = ()
+        start = 0
+        with self._lock:
+            for i in range(len(digests) - 1, -1, -1):
+                cached = self._summaries.get(digests[i])
+                if cached is not None:
+                    self._summaries.move_to_end(digests[i])
+                    self._stats['summary_cache_hits'] += 1
+                    lines, start = cached, i + 1
+                    break
+
+        for message in dropped[start:]:
+            line = self._summary_line(message)
+            if line:
+                lines = self._clip(lines + (line,))
+
+        if digests:
+            with self._lock:
+                self._summaries[digests[-1]] = lines
+                while len(self._summaries) > self.max_cached_summaries:
+                    self._summaries.popitem(last=False)
+        return '\n'.join(lines)
+
+    def _summary_line(self, message: Dict) -> Optional[str]:
+        content = message.get('content')
+        if not isinstance(content, str) or not content.strip():
+            return None
+        first = _FIRST_SENTENCE.match(content.strip()).group().strip()
+        if len(first) > self.line_max_chars:
+            first = first[:self.line_max_chars] + '…'
+        speaker = '用户' if message.get('role') == 'user' else '助手'
+        return f"{speaker}: {first}"
+
+    def _clip(self, lines: Tuple[str, ...]) -> Tuple[str, ...]:
+        """摘要超出上限时丢弃最早的行"""
+        total = sum(self.estimate_tokens(line) for line in lines)
+        while total > self.summary_max_tokens and len(lines) > 1:
+            total -= self.estimate_tokens(lines[0])
+            lines = lines[1:]
+        return lines
+
+    def _message_tokens(self, message: Dict) -> int:
+        return self.estimate_tokens(message.get('content', '')) + self.MESSAGE_OVERHEAD
+
+    @staticmethod
+    def _message_bytes(message: Dict) -> bytes:
+        return f"{message.get('role', '')}\0{message.get('content', '')}\0".encode('utf-8')
@@ -0,0 +1,250 @@
+import atexit
+import bisect
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class SensitiveEventLog:
+    """敏感词事件日志 (JSON Lines 追加写入，后台单线程批量落盘)
+
+    record() 只把事件放入内存队列；写线程在攒够 batch_size 条或距首条事件
+    超过 flush_interval 秒时整批追加写入并 fsync，单次写入成本与历史总量无关。
+
+    内存中维护按日期、按命中词的索引（记录号 -> 文件偏移），分页查询只读取
+    当前页的记录。
+    """
+
+    def __init__(self, path: str = 'sensitive_log.jsonl',
+                 legacy_path: Optional[str] = 'sensitive_log.json',
+                 batch_size: int = 50, flush_interval: float = 1.0):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue: 'queue.Queue' = queue.Queue()
+        self._closed = False
+
+        # 索引: 记录号即在文件中的顺序
+        self._index_lock = threading.Lock()
+        self._offsets: List[int] = []
+        self._by_date: Dict[str, List[int]] = {}
+        self._by_word: Dict[str, List[int]] = {}
+
+        self._migrate_legacy()
+        self._repair_tail()
+        self._build_index()
+
+        self._writer = threading.Thread(target=self._run_writer, name='sensitive-log-writer', daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def record(self, event: Dict[str, Any]):
+        """记录一条敏感词事件（非阻塞）"""
+        if self._closed:
+            raise RuntimeError("敏感词日志已关闭")
+        entry = {'date': datetime.now().strftime('%Y-%m-%d')}
+        entry.update(event)
+        self._queue.put(entry)
+
+    def flush(self, timeout: Optional[float] = 5.0) -> bool:
+        """等待队列中已有的事件全部落盘"""
+        if self._closed:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def query(self, date: Optional[str] = None, word: Optional[str] = None,
+              cursor: Optional[int] = None, limit: int = 20) -> Dict[str, Any]:
+        """
+        分页查询事件（按时间倒序）
+
+        Args:
+            date: 只返回该日期 (YYYY-MM-DD) 的事件
+            word: 只返回命中该词的事件
+            cursor: 上一页返回的 next_cursor，为空时从最新一条开始
+            limit: 每页条数
+
+        Returns:
+            {'records': [...], 'next_cursor': int 或 None}
+        """
+        if cursor is None:
+            self.flush()
+
+        with self._index_lock:
+            if date and word:
+                word_ids = self._by_word.get(word, [])
+                date_ids = self._by_date.get(date, [])
+                small, large = sorted((word_ids, date_ids), key=len)
+                large_set = set(large)
+                candidates = [i for i in small if i in large_set]
+            elif date:
+                candidates = self._by_date.get(date, [])
+            elif word:
+                candidates = self._by_word.get(word, [])
+            else:
+                candidates = range(len(self._offsets))
+
+            end = len(candidates) if cursor is None else bisect.bisect_left(candidates, cursor)
+            page_ids = [candidates[i] for i in range(end - 1, max(end - limit, 0) - 1, -1)]
+            offsets = [(i, self._offsets[i]) for i in page_ids]
+            has_more = end - len(page_ids) > 0
+
+        records = []
+        if not offsets:
+            return {'records': records, 'next_cursor': None}
+        with open(self.path, 'rb') as f:
+            for record_id, offset in offsets:
+                f.seek(offset)
+                try:
+                    entry = json.loads(f.readline().decode('utf-8'))
+                except ValueError:
+                    continue
+                entry['id'] = record_id
+                records.append(entry)
+
+        return {
+            'records': records,
+            'next_cursor': page_ids[-1] if has_more and page_ids else None
+        }
+
+    def get_summary(self) -> Dict[str, Any]:
+        """按日期、按命中词统计事件数"""
+        with self._index_lock:
+            return {
+                'total': len(self._offsets),
+                'dates': sorted(((d, len(ids)) for d, ids in self._by_date.items()), reverse=True),
+                'words': sorted(((w, len(ids)) for w, ids in self._by_word.items()), key=lambda x: -x[1])
+            }
+
+    def close(self):
+        """落盘剩余事件并停止写线程"""
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join(timeout=5.0)
+
+    def _run_writer(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            batch: List[Dict[str, Any]] = []
+            waiters: List[threading.Event] = []
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+
+            if batch:
+                self._write_batch(batch)
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                return
+
+    def _write_batch(self, batch: List[Dict[str, Any]]):
+        lines = [(json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8') for entry in batch]
+        try:
+            with open(self.path, 'ab') as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(b''.join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+        except Exception as e:
+            logger.error(f"写入敏感词日志失败: {str(e)}")
+            return
+
+        for entry, line in zip(batch, lines):
+            self._index_entry(offset, entry)
+            offset += len(line)
+        logger.debug(f"敏感词日志落盘: {len(batch)} 条")
+
+    def _index_entry(self, offset: int, entry: Dict[str, Any]):
+        date = entry.get('date') or str(entry.get('time', ''))[:10]
+        with self._index_lock:
+            record_id = len(self._offsets)
+            self._offsets.append(offset)
+            self._by_date.setdefault(date, []).append(record_id)
+            for word in set(entry.get('hit_words') or []):
+                self._by_word.setdefault(word, []).append(record_id)
+
+    def _build_index(self):
+        """启动时顺序扫描一次日志文件，建立内存索引"""
+        try:
+            with open(self.path, 'rb') as f:
+                offset = 0
+                for line in f:
+                    if line.strip():
+                        try:
+                            self._index_entry(offset, json.loads(line.decode('utf-8')))
+                        except ValueError:
+                            logger.warning("跳过损坏的敏感词日志行")
+                    offset += len(line)
+        except FileNotFoundError:
+            return
+        logger.info(f"敏感词日志索引已建立: {len(self._offsets)} 条")
+
+    def _repair_tail(self):
+        """若上次崩溃留下了不完整的末行，补一个换行避免与新记录粘连"""
+        try:
+            with open(self.path, 'rb+') as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() == 0:
+                    return
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    f.write(b'\n')
+        except FileNotFoundError:
+            return
+
+    def _migrate_legacy(self):
+        """把旧版 sensitive_log.json 的数据一次性迁移为 JSON Lines"""
+        if not self.legacy_path or os.path.exists(self.path) or not os.path.exists(self.legacy_path):
+            return
+        try:
+            with open(self.legacy_path, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+        except Exception as e:
+            logger.warning(f"旧版敏感词日志无法读取，跳过迁移: {str(e)}")
+            return
+
+        temp_path = self.path + '.tmp'
+        count = 0
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for date in sorted(legacy):
+                for record in legacy[date]:
+                    entry = {'date': date}
+                    entry.update(record)
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                    count += 1
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        logger.info(f"已迁移旧版敏感词日志: {count} 条 ({self.legacy_path} -> {self.path})")
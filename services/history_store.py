@@ -0,0 +1,153 @@
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL DEFAULT '新对话',
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_conversation_seq ON messages(conversation_id, seq);
+CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations(updated_at);
+"""
+
+class ChatHistoryStore:
+    """服务端聊天历史 (SQLite, WAL 模式)
+
+    每个会话一行，消息按 (会话, 序号) 建唯一索引，追加和按会话读取都走索引。
+    WAL 模式下读不阻塞写；每个线程使用自己的连接，写操作用 BEGIN IMMEDIATE
+    保证同一会话并发追加时序号不冲突。
+    """
+
+    def __init__(self, db_path: str = 'chat_history.db'):
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.executescript(_SCHEMA)
+        conn.close()
+        logger.info(f"聊天历史库已就绪: {db_path}")
+
+    def exists(self, conversation_id: str) -> bool:
+        row = self._conn().execute(
+            'SELECT 1 FROM conversations WHERE id = ?', (conversation_id,)
+        ).fetchone()
+        return row is not None
+
+    def message_count(self, conversation_id: str) -> Optional[int]:
+        """会话中的消息数，会话不存在时返回 None"""
+        row = self._conn().execute(
+            'SELECT message_count FROM conversations WHERE id = ?', (conversation_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_messages(self, conversation_id: str, with_time: bool = False) -> List[Dict[str, Any]]:
+        """按顺序返回会话的全部消息"""
+        rows = self._conn().execute(
+            'SELECT role, content, created_at FROM messages WHERE conversation_id = ? ORDER BY seq',
+            (conversation_id,)
+        ).fetchall()
+        if with_time:
+            return [{'role': r, 'content': c, 'timestamp': t} for r, c, t in rows]
+        return [{'role': r, 'content': c} for r, c, _ in rows]
+
+    def list_conversations(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """最近更新的会话列表"""
+        rows = self._conn().execute(
+            'SELECT id, title, created_at, updated_at, message_count FROM conversations '
+            'ORDER BY updated_at DESC LIMIT ?', (limit,)
+        ).fetchall()
+        return [{'id': i, 'title': t, 'created_at': c, 'updated_at': u, 'message_count': n}
+                for i, t, c, u, n in rows]
+
+    def append_messages(self, conversation_id: str, messages: List[Dict], title: Optional[str] = None):
+        """在会话末尾追加消息（会话不存在时创建）"""
+        now = datetime.now().isoformat()
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            self._ensure_conversation(conn, conversation_id, title, now)
+            count = conn.execute(
+                'SELECT message_count FROM conversations WHERE id = ?', (conversation_id,)
+            ).fetchone()[0]
+            self._insert(conn, conversation_id, messages, count, now)
+            conn.execute(
+                'UPDATE conversations SET message_count = ?, updated_at = ? WHERE id = ?',
+                (count + len(messages), now, conversation_id)
+            )
+
+    def replace_messages(self, conversation_id: str, messages: List[Dict], title: Optional[str] = None):
+        """用客户端上传的完整历史覆盖会话（首次同步时使用）"""
+        now = datetime.now().isoformat()
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            self._ensure_conversation(conn, conversation_id, title, now)
+            conn.execute('DELETE FROM messages WHERE conversation_id = ?', (conversation_id,))
+            self._insert(conn, conversation_id, messages, 0, now)
+            conn.execute(
+                'UPDATE conversations SET message_count = ?, updated_at = ? WHERE id = ?',
+                (len(messages), now, conversation_id)
+            )
+
+    def delete_conversation(self, conversation_id: str) -> bool:
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM messages WHERE conversation_id = ?', (conversation_id,))
+            deleted = conn.execute('DELETE FROM conversations WHERE id = ?', (conversation_id,)).rowcount
+        return deleted > 0
+
+    def clear(self):
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM messages')
+            conn.execute('DELETE FROM conversations')
+
+    def _ensure_conversation(self, conn: sqlite3.Connection, conversation_id: str,
+                             title: Optional[str], now: str):
+        conn.execute(
+            'INSERT OR IGNORE INTO conversations (id, title, created_at, updated_at) VALUES (?, ?, ?, ?)',
+            (conversation_id, title or '新对话', now, now)
+        )
+        if title:
+            conn.execute('UPDATE conversations SET title = ? WHERE id = ?', (title, conversation_id))
+
+    def _insert(self, conn: sqlite3.Connection, conversation_id: str, messages: List[Dict],
+                start_seq: int, now: str):
+        conn.executemany(
+            'INSERT INTO messages (conversation_id, seq, role, content, created_at) VALUES (?, ?, ?, ?, ?)',
+            [(conversation_id, start_seq + i, m.get('role', 'user'), str(m.get('content', '')),
+              m.get('timestamp') or now)
+             for i, m in enumerate(messages)]
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None：由 BEGIN IMMEDIATE / with conn 显式控制事务
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA foreign_keys=ON')
+        return conn
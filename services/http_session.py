@@ -0,0 +1,186 @@
+import logging
+import os
+import threading
+import uuid
+from typing import Any, Dict, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+class ProviderSessionPool:
+    """按提供商复用的 HTTP 连接池
+
+    每个提供商一个 requests.Session，保持 keep-alive 连接，避免每轮对话都
+    重新建立 TCP 连接和 TLS 握手；对 429/5xx 自动按指数退避重试。
+    """
+
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+
+    def __init__(self, pool_size: int = 10,
+                 timeout: Union[float, Tuple[float, float]] = (5, 30),
+                 max_retries: int = 2, backoff_factor: float = 0.5):
+        """
+        Args:
+            pool_size: 每个提供商保持的最大连接数
+            timeout: 默认超时，(连接超时, 读取超时) 或单个秒数
+            max_retries: 429/5xx/连接错误的最大重试次数
+            backoff_factor: 重试退避系数，第 n 次重试等待 backoff_factor * 2^(n-1) 秒
+        """
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+
+        self._sessions: Dict[str, requests.Session] = {}
+        self._requests: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get_session(self, provider: str) -> requests.Session:
+        """获取（必要时创建）提供商对应的会话"""
+        session = self._sessions.get(provider)
+        if session is not None:
+            return session
+
+        with self._lock:
+            session = self._sessions.get(provider)
+            if session is None:
+                session = self._create_session()
+                self._sessions[provider] = session
+                self._requests[provider] = 0
+                logger.info(f"创建HTTP连接池: provider={provider}, pool_size={self.pool_size}")
+            return session
+
+    def post(self, provider: str, url: str, **kwargs) -> requests.Response:
+        """通过提供商的连接池发送 POST 请求"""
+        return self.request(provider, 'POST', url, **kwargs)
+
+    def request(self, provider: str, method: str, url: str, **kwargs) -> requests.Response:
+        session = self.get_session(provider)
+        kwargs.setdefault('timeout', self.timeout)
+        with self._lock:
+            self._requests[provider] += 1
+        return session.request(method, url, **kwargs)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """连接复用统计"""
+        metrics = {}
+        with self._lock:
+            providers = list(self._sessions.items())
+            request_counts = dict(self._requests)
+
+        for provider, session in providers:
+            connections = 0
+            # 同一个 adapter 同时挂载在 http:// 与 https:// 上，需去重
+            for adapter in {id(a): a for a in session.adapters.values()}.values():
+                pools = adapter.poolmanager.pools
+                for key in list(pools.keys()):
+                    pool = pools.get(key)
+                    if pool is not None:
+                        connections += pool.num_connections
+            total = request_counts.get(provider, 0)
+            metrics[provider] = {
+                'requests': total,
+                'connections_opened': connections,
+                'reuse_ratio': round(1 - connections / total, 3) if total else None
+            }
+        return metrics
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+    def _create_session(self) -> requests.Session:
+        retry = Retry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=0,  # 读取超时说明服务端已在处理，不自动重发
+            status=self.max_retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=self.RETRY_STATUS,
+            allowed_methods=frozenset(['GET', 'POST']),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size,
+                              max_retries=retry, pool_block=False)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+class MultipartBody:
+    """流式 multipart/form-data 请求体
+
+    文件部分直接从调用方给出的二进制流中按块读取，不预先拼接整个请求体、
+    也不落临时文件。实现 read/tell/seek/__len__，requests 会据此发送
+    Content-Length，urllib3 重试时也能回绕到开头重新发送。
+    """
+
+    def __init__(self, fields: Dict[str, str], file_field: str, filename: str,
+                 fileobj: Any, content_type: str = 'application/octet-stream'):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f'multipart/form-data; boundary={self.boundary}'
+
+        head = b''.join(
+            f'--{self.boundary}\r\n'
+            f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+            f'{value}\r\n'.encode('utf-8')
+            for name, value in fields.items()
+        )
+        head += (
+            f'--{self.boundary}\r\n'
+            f'Content-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'
+        ).encode('utf-8')
+        tail = f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
+
+        self._file = fileobj
+        self._file_start = fileobj.tell()
+        self._file_size = fileobj.seek(0, os.SEEK_END) - self._file_start
+        fileobj.seek(self._file_start)
+
+        self._head = head
+        self._tail = tail
+        self._pos = 0
+
+    def __len__(self) -> int:
+        return len(self._head) + self._file_size + len(self._tail)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += len(self)
+        self._pos = max(0, min(offset, len(self)))
+        file_offset = min(max(self._pos - len(self._head), 0), self._file_size)
+        self._file.seek(self._file_start + file_offset)
+        return self._pos
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = len(self) - self._pos
+        out = []
+        while size > 0 and self._pos < len(self):
+            head_len = len(self._head)
+            file_end = head_len + self._file_size
+            if self._pos < head_len:
+                chunk = self._head[self._pos:self._pos + size]
+            elif self._pos < file_end:
+                chunk = self._file.read(min(size, file_end - self._pos))
+                if not chunk:
+                    raise IOError("上传的音频流提前结束")
+            else:
+                offset = self._pos - file_end
+                chunk = self._tail[offset:offset + size]
+            out.append(chunk)
+            self._pos += len(chunk)
+            size -= len(chunk)
+        return b''.join(out)
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class Live2DCatalog:
+    """Live2D 模型目录索引
+
+    启动时扫描一次模型目录，解析每个 .model3.json 的贴图、动作、表情列表
+    并统计模型文件总大小，结果序列化后常驻内存。后台线程定期比较目录、
+    model3.json 及其引用的贴图、动作等文件的修改时间和大小，有变化才重建；
+    请求只读内存中的结果和 ETag。
+    """
+
+    def __init__(self, models_dir: str, url_prefix: str = '/static/live2d_models',
+                 refresh_interval: float = 5.0):
+        """
+        Args:
+            models_dir: 模型根目录，每个子目录一个模型
+            url_prefix: 模型文件对外的 URL 前缀
+            refresh_interval: 检查修改时间的间隔（秒），0 表示不后台刷新
+        """
+        self.models_dir = models_dir
+        self.url_prefix = url_prefix.rstrip('/')
+        self.refresh_interval = refresh_interval
+
+        self._lock = threading.Lock()
+        self._signature: Optional[Tuple] = None
+        # 上次重建时 model3.json 引用的文件，纳入变化检测
+        self._referenced: List[str] = []
+        self._models: List[Dict[str, Any]] = []
+        self._payload = b'[]'
+        self._etag = ''
+        self._stop = threading.Event()
+
+        self.refresh()
+        if refresh_interval > 0:
+            threading.Thread(target=self._watch, name='live2d-catalog', daemon=True).start()
+
+    def get(self) -> Tuple[bytes, str]:
+        """返回 (序列化后的模型列表, ETag)"""
+        with self._lock:
+            return self._payload, self._etag
+
+    def get_models(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._models)
+
+    def refresh(self, force: bool = False) -> bool:
+        """目录有变化（或 force）时重建索引，返回是否重建"""
+        if not force and self._scan_signature(self._referenced) == self._signature:
+            return False
+
+        referenced: List[str] = []
+        models = [self._describe(name, file, referenced) for name, file in self._model_files()]
+        payload = json.dumps(models, ensure_ascii=False).encode('utf-8')
+        signature = self._scan_signature(referenced)
+        with self._lock:
+            self._signature = signature
+            self._referenced = referenced
+            self._models = models
+            self._payload = payload
+            self._etag = hashlib.sha1(payload).hexdigest()
+        logger.info(f"Live2D模型索引已更新: {len(models)} 个模型")
+        return True
+
+    def close(self):
+        self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"刷新Live2D模型索引失败: {str(e)}")
+
+    def _model_files(self) -> List[Tuple[str, str]]:
+        """[(模型目录名, model3.json 文件名)]"""
+        found = []
+        if not os.path.isdir(self.models_dir):
+            return found
+        for entry in sorted(os.scandir(self.models_dir), key=lambda e: e.name):
+            if not entry.is_dir():
+                continue
+            for file in sorted(os.listdir(entry.path)):
+                if file.endswith('.model3.json'):
+                    found.append((entry.name, file))
+        return found
+
+    def _scan_signature(self, referenced: List[str]) -> Tuple:
+        """根目录、各模型目录及 model3.json 的修改时间，以及引用文件的修改时间和大小"""
+        if not os.path.isdir(self.models_dir):
+            return ()
+        parts = [os.stat(self.models_dir).st_mtime_ns]
+        for entry in os.scandir(self.models_dir):
+            if not entry.is_dir():
+                continue
+            parts.append((entry.name, entry.stat().st_mtime_ns))
+            for file in os.listdir(entry.path):
+                if file.endswith('.model3.json'):
+                    parts.append((entry.name, file, os.stat(os.path.join(entry.path, file)).st_mtime_ns))
+        for path in referenced:
+            try:
+                stat = os.stat(path)
+                parts.append((path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                parts.append((path, None, None))
+        return tuple(sorted(parts, key=str))
+
+    def _describe(self, name: str, file: str, referenced: List[str]) -> Dict[str, Any]:
+        """解析 model3.json，汇总贴图、动作、表情和文件大小，引用的文件路径追加到 referenced"""
+        model_dir = os.path.join(self.models_dir, name)
+        model = {
+            'name': name,
+            'json': f'{self.url_prefix}/{name}/{file}',
+            'textures': [],
+            'motions': {},
+            'expressions': [],
+            'total_bytes': 0
+        }
+        try:
+            with open(os.path.join(model_dir, file), 'r', encoding='utf-8') as f:
+                refs = json.load(f).get('FileReferences', {})
+        except (OSError, ValueError) as e:
+            logger.warning(f"无法解析Live2D模型文件 {name}/{file}: {str(e)}")
+            return model
+
+        model['textures'] = list(refs.get('Textures', []))
+        model['motions'] = {
+            group: [motion.get('File') for motion in motions if motion.get('File')]
+            for group, motions in (refs.get('Motions') or {}).items()
+        }
+        model['expressions'] = [e.get('Name') for e in refs.get('Expressions', []) if e.get('Name')]
+
+        files = {file}
+        files.update(model['textures'])
+        for key in ('Moc', 'Physics', 'Pose', 'DisplayInfo', 'UserData'):
+            if refs.get(key):
+                files.add(refs[key])
+        for motions in (refs.get('Motions') or {}).values():
+            for motion in motions:
+                files.update(v for k, v in motion.items() if k in ('File', 'Sound') and v)
+        files.update(e.get('File') for e in refs.get('Expressions', []) if e.get('File'))
+
+        for path in files:
+            path = os.path.join(model_dir, path)
+            referenced.append(path)
+            try:
+                model['total_bytes'] += os.path.getsize(path)
+            except OSError:
+                pass
+        return model
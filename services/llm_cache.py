@@ -0,0 +1,182 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 归一化时去掉的标点和空白
+_NOISE = re.compile(r'[\s。，、！？!?,.~～…:：;；"“”\'‘’()（）]+')
+
+class LLMResponseCache:
+    """LLM回复缓存
+
+    精确层：以 (提供商, 模型, 温度档位, 之前全部消息的链式哈希, 末尾若干条
+    消息归一化后的文本) 为键，命中即直接返回上次的回复；系统提示词或更早的
+    上文不同的会话互不命中。相似层（可选）：上文相同、最后一条用户消息的
+    字符二元组 Jaccard 相似度不低于 similarity_threshold 时也视为命中，
+    用于"讲个故事"/"讲个故事吧"这类近似提问。
+
+    条目按 TTL 过期，总数超过 max_entries 时淘汰最久未使用的条目。
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600,
+                 trailing_messages: int = 3, temperature_step: float = 0.5,
+                 similarity_threshold: Optional[float] = None):
+        """
+        Args:
+            max_entries: 最多缓存的回复数
+            ttl: 回复的有效期（秒）
+            trailing_messages: 归一化后参与计算键的末尾消息条数（忽略标点、
+                空白和大小写差异），更早的消息（含系统提示词）按原文哈希
+            temperature_step: 温度分档宽度，同一档内的温度共用缓存
+            similarity_threshold: 相似层阈值 (0~1)，None 表示关闭相似层
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.trailing_messages = trailing_messages
+        self.temperature_step = temperature_step
+        self.similarity_threshold = similarity_threshold
+
+        self._lock = threading.Lock()
+        # key -> (过期时间, 回复, 相似层分组, 末条消息的二元组)
+        self._entries: 'OrderedDict[str, Tuple[float, str, str, frozenset]]' = OrderedDict()
+        # 相似层倒排索引：分组 -> 二元组 -> 键集合
+        self._grams: Dict[str, Dict[str, Set[str]]] = {}
+        self._stats = {'hits': 0, 'similar_hits': 0, 'misses': 0,
+                       'stores': 0, 'evictions': 0, 'expired': 0}
+
+    def get(self, provider: str, model: str, messages: List[Dict],
+            temperature: float) -> Optional[str]:
+        """查询缓存，未命中返回 None"""
+        key, group, grams = self._describe(provider, model, messages, temperature)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                self._remove(key)
+                self._stats['expired'] += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return entry[1]
+
+            if self.similarity_threshold is not None and grams:
+                similar_key = self._find_similar(group, grams, now)
+                if similar_key is not None:
+                    self._entries.move_to_end(similar_key)
+                    self._stats['similar_hits'] += 1
+                    return self._entries[similar_key][1]
+
+            self._stats['misses'] += 1
+            return None
+
+    def put(self, provider: str, model: str, messages: List[Dict],
+            temperature: float, response: str):
+        if not response:
+            return
+        key, group, grams = self._describe(provider, model, messages, temperature)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() + self.ttl, response, group, grams)
+            if self.similarity_threshold is not None:
+                index = self._grams.setdefault(group, {})
+                for gram in grams:
+                    index.setdefault(gram, set()).add(key)
+            self._stats['stores'] += 1
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self._stats['hits'] + self._stats['similar_hits']
+            lookups = hits + self._stats['misses']
+            return dict(self._stats,
+                        hit_ratio=round(hits / lookups, 3) if lookups else None,
+                        entries=len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._grams.clear()
+
+    def _describe(self, provider: str, model: str, messages: List[Dict],
+                  temperature: float) -> Tuple[str, str, frozenset]:
+        """计算 (精确键, 相似层分组, 末条消息的二元组)"""
+        split = max(len(messages) - self.trailing_messages, 0)
+        tail = [(m.get('role', ''), self._normalize(m.get('content', '')))
+                for m in messages[split:]]
+        bucket = round(temperature / self.temperature_step) if self.temperature_step else temperature
+        prefix = b''
+        for message in messages[:split]:
+            prefix = self._chain_digest(prefix, message)
+        head = [provider, model, bucket, prefix.hex()]
+
+        key = self._digest(head + tail)
+        # 相似层只比较最后一条消息，其余上文必须完全相同
+        group = self._digest(head + tail[:-1] + [tail[-1][0] if tail else ''])
+        last = tail[-1][1] if tail else ''
+        grams = frozenset(last[i:i + 2] for i in range(max(len(last) - 1, 1))) if last else frozenset()
+        return key, group, grams
+
+    def _find_similar(self, group: str, grams: frozenset, now: float) -> Optional[str]:
+        """在同一分组中找 Jaccard 相似度最高且达到阈值的条目（需持有锁）"""
+        index = self._grams.get(group)
+        if not index:
+            return None
+        overlap: Dict[str, int] = {}
+        for gram in grams:
+            for key in index.get(gram, ()):
+                overlap[key] = overlap.get(key, 0) + 1
+
+        best_key, best_score = None, self.similarity_threshold
+        for key, shared in overlap.items():
+            expires, _, _, other = self._entries[key]
+            if expires <= now:
+                continue
+            score = shared / (len(grams) + len(other) - shared)
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def _remove(self, key: str):
+        """删除条目及其相似层索引（需持有锁）"""
+        _, _, group, grams = self._entries.pop(key)
+        index = self._grams.get(group)
+        if not index:
+            return
+        for gram in grams:
+            keys = index.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del index[gram]
+        if not index:
+            del self._grams[group]
+
+    @staticmethod
+    def _normalize(content: Any) -> str:
+        if not isinstance(content, str):
+            content = json.dumps(content, ensure_ascii=False, sort_keys=True)
+        return _NOISE.sub(' ', content).strip().lower()
+
+    @staticmethod
+    def _chain_digest(prev: bytes, message: Dict) -> bytes:
+        h = hashlib.sha1(prev)
+        h.update(str(message.get('role', '')).encode('utf-8'))
+        h.update(b'\0')
+        h.update(str(message.get('content', '')).encode('utf-8'))
+        return h.digest()
+
+    @staticmethod
+    def _digest(parts: List[Any]) -> str:
+        raw = json.dumps(parts, ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
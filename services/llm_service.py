@@ -1,28 +1,158 @@
 import requests
+import functools
 import json
 import logging
-from typing import List, Dict, Any
+from typing import Callable, List, Dict, Any, Iterator, Optional, Tuple
+
+from .http_session import ProviderSessionPool
+from .context_window import ContextManager
+from .llm_cache import LLMResponseCache
+from .provider_router import ProviderRouter
 
 logger = logging.getLogger(__name__)
 
 class LLMService:
     """大语言模型服务"""
     
-    def __init__(self):
+    def __init__(self, session_pool: Optional[ProviderSessionPool] = None,
+                 cache: Optional[LLMResponseCache] = None,
+                 context: Optional[ContextManager] = None,
+                 router: Optional[ProviderRouter] = None):
+        self.session_pool = session_pool or ProviderSessionPool()
+        self.cache = cache
+        self.context = context or ContextManager()
+        self.router = router
         self.supported_providers = {
             'deepseek': self._call_deepseek,
             'kimi': self._call_kimi
         }
+        self.streaming_providers = {
+            'deepseek': self._stream_deepseek,
+            'kimi': self._stream_kimi
+        }
     
     def get_supported_providers(self) -> List[str]:
         """获取支持的LLM提供商列表"""
         return list(self.supported_providers.keys())
     
+    def get_metrics(self) -> Dict[str, Any]:
+        """获取LLM调用统计"""
+        return {
+            'connections': self.session_pool.get_metrics(),
+            'cache': self.cache.get_metrics() if self.cache else None,
+            'context': self.context.get_metrics(),
+            'routing': self.router.get_metrics() if self.router else None
+        }
+    
     def call_llm(self, provider: str, messages: List[Dict], model: str, 
                  temperature: float, api_key: str, **kwargs) -> str:
         """
         调用指定的LLM服务
+        
+        Args:
+            fallback: 可选的备用提供商凭据 {provider, api_key, model}，
+                启用路由时用于故障转移和对冲请求
+        """
+        fallback = kwargs.pop('fallback', None)
+        self._check_call(provider, model, api_key)
+        
+        cached = self._cache_get(provider, messages, model, temperature)
+        if cached is not None:
+            return cached
+        
+        attempts, models = self._attempts(self.supported_providers, provider, messages, model,
+                                          temperature, api_key, fallback, **kwargs)
+        used = provider
+        try:
+            if self.router is None:
+                response = attempts[0][1]()
+            else:
+                used, response = self.router.call(attempts)
+        except Exception as e:
+            raise self._translate_error(getattr(e, 'provider', provider), e)
+        # 按实际返回回复的提供商和模型缓存，备用提供商的回复不会被当作首选的回复
+        self._cache_put(used, messages, models[used], temperature, response)
+        return response
+    
+    def stream_llm(self, provider: str, messages: List[Dict], model: str,
+                   temperature: float, api_key: str, **kwargs) -> Iterator[str]:
+        """
+        流式调用指定的LLM服务
+        
+        Returns:
+            逐段产出回复文本的生成器
+        """
+        fallback = kwargs.pop('fallback', None)
+        self._check_call(provider, model, api_key)
+        
+        cached = self._cache_get(provider, messages, model, temperature)
+        if cached is not None:
+            yield cached
+            return
+        
+        attempts, models = self._attempts(self.streaming_providers, provider, messages, model,
+                                          temperature, api_key, fallback, **kwargs)
+        parts = []
+        used = provider
+        try:
+            if self.router is None:
+                chunks = attempts[0][1]()
+            else:
+                used, chunks = self.router.stream(attempts)
+            for content in chunks:
+                parts.append(content)
+                yield content
+        except Exception as e:
+            raise self._translate_error(getattr(e, 'provider', used), e)
+        # 只缓存完整结束的回复，键为实际提供回复的提供商和模型
+        self._cache_put(used, messages, models[used], temperature, ''.join(parts))
+    
+    def _attempts(self, table: Dict[str, Callable], provider: str, messages: List[Dict],
+                  model: str, temperature: float, api_key: str,
+                  fallback: Optional[Dict[str, str]] = None,
+                  **kwargs) -> Tuple[List[Tuple[str, Callable]], Dict[str, str]]:
         """
+        首选提供商的调用，以及（启用路由且有可用备用时）备用提供商的等价调用
+
+        Returns:
+            ([(提供商, 无参调用)], {提供商: 模型})
+        """
+        attempts = [(provider, functools.partial(
+            table[provider], self._fit_context(provider, model, messages, **kwargs),
+            model, temperature, api_key, **kwargs
+        ))]
+        models = {provider: model}
+        if self.router is not None:
+            backup = self.router.fallback_for(provider, fallback, list(table))
+            if backup and backup['provider'] in table:
+                other, other_model = backup['provider'], backup.get('model', '')
+                attempts.append((other, functools.partial(
+                    table[other], self._fit_context(other, other_model, messages, **kwargs),
+                    other_model, temperature, backup['api_key'], **kwargs
+                )))
+                models[other] = other_model
+        return attempts, models
+    
+    def _fit_context(self, provider: str, model: str, messages: List[Dict], **kwargs) -> List[Dict]:
+        """按模型上下文预算裁剪历史消息"""
+        return self.context.fit(provider, model, messages, kwargs.get('max_tokens', 1000))
+    
+    def _cache_get(self, provider: str, messages: List[Dict], model: str,
+                   temperature: float) -> Optional[str]:
+        if self.cache is None:
+            return None
+        cached = self.cache.get(provider, model, messages, temperature)
+        if cached is not None:
+            logger.info(f"LLM回复缓存命中: provider={provider}, model={model}")
+        return cached
+    
+    def _cache_put(self, provider: str, messages: List[Dict], model: str,
+                   temperature: float, response: str):
+        if self.cache is not None:
+            self.cache.put(provider, model, messages, temperature, response)
+    
+    def _check_call(self, provider: str, model: str, api_key: str):
+        """调用前的参数检查"""
         if provider not in self.supported_providers:
             raise ValueError(f"不支持的提供商: {provider}")
         
@@ -32,33 +162,34 @@ class LLMService:
         # 记录API调用信息（不记录完整API Key）
         masked_key = f"{api_key[:8]}...{api_key[-4:]}" if len(api_key) > 12 else "***"
         logger.info(f"调用LLM: provider={provider}, model={model}, api_key={masked_key}")
-        
-        try:
-            return self.supported_providers[provider](
-                messages, model, temperature, api_key, **kwargs
-            )
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 401:
-                raise ValueError(f"API Key无效或已过期 [{provider}]: 请检查API Key是否正确")
-            elif e.response.status_code == 403:
-                raise ValueError(f"访问被拒绝 [{provider}]: 请检查API Key权限或账户状态")
-            elif e.response.status_code == 429:
-                raise ValueError(f"请求频率过高 [{provider}]: 请稍后重试")
-            elif e.response.status_code == 500:
-                raise ValueError(f"服务器内部错误 [{provider}]: 请稍后重试")
-            else:
-                logger.error(f"LLM调用HTTP错误 [{provider}]: {e}")
-                raise ValueError(f"API调用失败 [{provider}]: {e}")
-        except requests.exceptions.RequestException as e:
+    
+    def _translate_error(self, provider: str, e: Exception) -> Exception:
+        """把底层异常转换为面向用户的错误信息"""
+        if isinstance(e, requests.exceptions.HTTPError):
+            return self._translate_status(provider, e.response.status_code, e)
+        if isinstance(e, requests.exceptions.RequestException):
             logger.error(f"LLM调用网络错误 [{provider}]: {str(e)}")
-            raise ValueError(f"网络连接失败 [{provider}]: 请检查网络连接")
-        except Exception as e:
-            logger.error(f"LLM调用失败 [{provider}]: {str(e)}")
-            raise
+            return ValueError(f"网络连接失败 [{provider}]: 请检查网络连接")
+        logger.error(f"LLM调用失败 [{provider}]: {str(e)}")
+        return e
+    
+    def _translate_status(self, provider: str, status: int, e: Exception) -> Exception:
+        """按HTTP状态码给出错误信息"""
+        if status == 401:
+            return ValueError(f"API Key无效或已过期 [{provider}]: 请检查API Key是否正确")
+        elif status == 403:
+            return ValueError(f"访问被拒绝 [{provider}]: 请检查API Key权限或账户状态")
+        elif status == 429:
+            return ValueError(f"请求频率过高 [{provider}]: 请稍后重试")
+        elif status == 500:
+            return ValueError(f"服务器内部错误 [{provider}]: 请稍后重试")
+        else:
+            logger.error(f"LLM调用HTTP错误 [{provider}]: {e}")
+            return ValueError(f"API调用失败 [{provider}]: {e}")
 
-    def _call_deepseek(self, messages: List[Dict], model: str, temperature: float, 
-                       api_key: str, **kwargs) -> str:
-        """调用DeepSeek API (华为云MaaS)"""
+    def _deepseek_request(self, messages: List[Dict], model: str, temperature: float,
+                          api_key: str, stream: bool = False, **kwargs) -> Dict[str, Any]:
+        """构造DeepSeek API (华为云MaaS) 请求参数"""
         headers = {
             'Content-Type': 'application/json',
             'Authorization': f'Bearer {api_key}'
@@ -68,35 +199,22 @@ class LLMService:
             'model': 'DeepSeek-V3',  # 固定使用DeepSeek-V3模型
             'messages': messages,
             'temperature': temperature,
-            'stream': False,  # 关闭流式输出以简化处理
+            'stream': stream,
             'max_tokens': kwargs.get('max_tokens', 1000)
         }
         
-        logger.debug(f"DeepSeek MaaS API请求: model={data['model']}, messages_count={len(messages)}")
+        logger.debug(f"DeepSeek MaaS API请求: model={data['model']}, messages_count={len(messages)}, stream={stream}")
         
-        response = requests.post(
-            'https://api.modelarts-maas.com/v1/chat/completions',
-            headers=headers,
-            data=json.dumps(data),
-            verify=False,  # 按照示例代码设置
-            timeout=30
-        )
-        
-        # 详细的错误信息
-        if not response.ok:
-            try:
-                error_detail = response.json()
-                logger.error(f"DeepSeek MaaS API错误详情: {error_detail}")
-            except:
-                logger.error(f"DeepSeek MaaS API错误: status={response.status_code}, text={response.text}")
-        
-        response.raise_for_status()
-        result = response.json()
-        return result['choices'][0]['message']['content']
+        return {
+            'url': 'https://api.modelarts-maas.com/v1/chat/completions',
+            'headers': headers,
+            'data': json.dumps(data),
+            'verify': False  # 按照示例代码设置
+        }
     
-    def _call_kimi(self, messages: List[Dict], model: str, temperature: float, 
-                   api_key: str, **kwargs) -> str:
-        """调用Kimi (月之暗面) API"""
+    def _kimi_request(self, messages: List[Dict], model: str, temperature: float,
+                      api_key: str, stream: bool = False, **kwargs) -> Dict[str, Any]:
+        """构造Kimi (月之暗面) API 请求参数"""
         headers = {
             'Authorization': f'Bearer {api_key}',
             'Content-Type': 'application/json'
@@ -106,29 +224,96 @@ class LLMService:
             'model': model or 'moonshot-v1-8k',
             'messages': messages,
             'temperature': temperature,
+            'stream': stream,
             'max_tokens': kwargs.get('max_tokens', 1000)
         }
         
-        logger.debug(f"Kimi API请求: model={data['model']}, messages_count={len(messages)}")
-        
-        response = requests.post(
-            'https://api.moonshot.cn/v1/chat/completions',
-            headers=headers,
-            json=data,
-            timeout=30
-        )
+        logger.debug(f"Kimi API请求: model={data['model']}, messages_count={len(messages)}, stream={stream}")
         
-        # 详细的错误信息
+        return {
+            'url': 'https://api.moonshot.cn/v1/chat/completions',
+            'headers': headers,
+            'json': data
+        }
+
+    def _call_deepseek(self, messages: List[Dict], model: str, temperature: float, 
+                       api_key: str, **kwargs) -> str:
+        """调用DeepSeek API (华为云MaaS)"""
+        request_kwargs = self._deepseek_request(messages, model, temperature, api_key, **kwargs)
+        response = self.session_pool.post('deepseek', **request_kwargs)
+        self._check_response('DeepSeek MaaS', response)
+        result = response.json()
+        return result['choices'][0]['message']['content']
+    
+    def _call_kimi(self, messages: List[Dict], model: str, temperature: float, 
+                   api_key: str, **kwargs) -> str:
+        """调用Kimi (月之暗面) API"""
+        request_kwargs = self._kimi_request(messages, model, temperature, api_key, **kwargs)
+        response = self.session_pool.post('kimi', **request_kwargs)
+        self._check_response('Kimi', response)
+        result = response.json()
+        return result['choices'][0]['message']['content']
+    
+    def _stream_deepseek(self, messages: List[Dict], model: str, temperature: float,
+                         api_key: str, **kwargs) -> Iterator[str]:
+        """流式调用DeepSeek API (华为云MaaS)"""
+        request_kwargs = self._deepseek_request(messages, model, temperature, api_key, stream=True, **kwargs)
+        response = self.session_pool.post('deepseek', stream=True, **request_kwargs)
+        self._check_response('DeepSeek MaaS', response)
+        yield from self._iter_sse_content(response)
+    
+    def _stream_kimi(self, messages: List[Dict], model: str, temperature: float,
+                     api_key: str, **kwargs) -> Iterator[str]:
+        """流式调用Kimi (月之暗面) API"""
+        request_kwargs = self._kimi_request(messages, model, temperature, api_key, stream=True, **kwargs)
+        response = self.session_pool.post('kimi', stream=True, **request_kwargs)
+        self._check_response('Kimi', response)
+        yield from self._iter_sse_content(response)
+    
+    def _check_response(self, label: str, response: requests.Response):
+        """记录详细的错误信息并在失败时抛出HTTPError"""
         if not response.ok:
             try:
                 error_detail = response.json()
-                logger.error(f"Kimi API错误详情: {error_detail}")
+                logger.error(f"{label} API错误详情: {error_detail}")
             except:
-                logger.error(f"Kimi API错误: status={response.status_code}, text={response.text}")
+                logger.error(f"{label} API错误: status={response.status_code}, text={response.text}")
         
         response.raise_for_status()
-        result = response.json()
-        return result['choices'][0]['message']['content']
+    
+    def _iter_sse_content(self, response: requests.Response) -> Iterator[str]:
+        """
+        解析OpenAI兼容的SSE流，逐段产出 delta.content
+        
+        两个提供商的流格式相同: 每个事件为一行 "data: {json}"，以 "data: [DONE]" 结束
+        """
+        try:
+            for line in response.iter_lines():
+                content = self._parse_sse_line(line)
+                if content is None:
+                    break
+                if content:
+                    yield content
+        finally:
+            response.close()
+    
+    def _parse_sse_line(self, line: bytes) -> Optional[str]:
+        """解析一行SSE数据，返回其中的 delta.content（可能为空串）；流结束时返回 None"""
+        line = line.strip()
+        if not line.startswith(b'data:'):
+            return ''
+        payload = line[5:].strip()
+        if payload == b'[DONE]':
+            return None
+        try:
+            chunk = json.loads(payload)
+        except ValueError:
+            logger.warning(f"无法解析的SSE数据: {payload[:100]!r}")
+            return ''
+        choices = chunk.get('choices') or []
+        if not choices:
+            return ''
+        return (choices[0].get('delta') or {}).get('content') or ''
 
     def validate_config(self, provider: str, api_key: str, model: str) -> Dict[str, Any]:
         """验证配置参数"""
@@ -0,0 +1,123 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional
+
+try:
+    from faster_whisper import WhisperModel
+except ImportError:  # 可选依赖，未安装时本地引擎不可用
+    WhisperModel = None
+
+try:
+    from faster_whisper import BatchedInferencePipeline
+except ImportError:  # faster-whisper 1.1 之前没有批量推理
+    BatchedInferencePipeline = None
+
+logger = logging.getLogger(__name__)
+
+# 工作进程内常驻的模型实例，以及每次识别的额外参数
+_worker_model = None
+_worker_options: Dict[str, Any] = {}
+
+def _init_worker(model_size: str, compute_type: str, cpu_threads: int, batch_size: int):
+    """工作进程初始化：加载一次模型，之后一直复用"""
+    global _worker_model, _worker_options
+    _worker_model = WhisperModel(model_size, device='cpu', compute_type=compute_type,
+                                 cpu_threads=cpu_threads)
+    if batch_size > 1 and BatchedInferencePipeline is not None:
+        _worker_model = BatchedInferencePipeline(model=_worker_model)
+        _worker_options = {'batch_size': batch_size}
+
+def _warm_up() -> int:
+    return os.getpid()
+
+def _transcribe_one(audio: bytes, language: Optional[str]) -> str:
+    """在工作进程中识别一段音频"""
+    segments, _ = _worker_model.transcribe(io.BytesIO(audio), language=language,
+                                           beam_size=1, vad_filter=True, **_worker_options)
+    return ''.join(segment.text for segment in segments).strip()
+
+class LocalASRPool:
+    """本地离线ASR模型池 (faster-whisper, 纯CPU)
+
+    模型在每个工作进程启动时加载一次并常驻；识别在独立进程中进行，不占用
+    Flask 进程的 GIL。每个请求单独提交，空闲的工作进程立即接手，
+    并发请求分散到所有工作进程上。
+
+    faster-whisper 的识别接口一次只处理一段音频，不支持把不同请求拼成一批
+    解码；batch_size > 1 时改用 BatchedInferencePipeline，把同一段音频按VAD
+    切出的片段成批解码，缩短长音频的识别时间。
+    """
+
+    def __init__(self, model_size: str = 'small', workers: int = 2,
+                 compute_type: str = 'int8', cpu_threads: int = 2, batch_size: int = 0):
+        """
+        Args:
+            model_size: faster-whisper 模型名或本地模型目录
+            workers: 工作进程数（每个进程各加载一份模型）
+            compute_type: CPU 推理精度，int8 内存占用最小
+            cpu_threads: 每个工作进程的推理线程数
+            batch_size: 同一段音频内成批解码的片段数，0 表示逐段解码
+        """
+        self.model_size = model_size
+        self.workers = workers
+        self.compute_type = compute_type
+        self.cpu_threads = cpu_threads
+        self.batch_size = batch_size
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._in_flight = 0
+        self._stats = {'requests': 0, 'errors': 0}
+
+    @staticmethod
+    def available() -> bool:
+        """faster-whisper 是否已安装"""
+        return WhisperModel is not None
+
+    def start(self):
+        """启动工作进程并预热模型（不阻塞调用方）"""
+        if self._executor is not None:
+            return
+        if not self.available():
+            raise RuntimeError("本地ASR需要安装 faster-whisper")
+
+        # spawn 方式启动，避免 fork 带着 Flask 进程里的线程和锁
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.model_size, self.compute_type, self.cpu_threads, self.batch_size)
+        )
+        for _ in range(self.workers):
+            self._executor.submit(_warm_up)
+        logger.info(f"本地ASR模型池启动: model={self.model_size}, workers={self.workers}, compute_type={self.compute_type}")
+
+    async def transcribe(self, audio: bytes, language: Optional[str] = None) -> str:
+        """识别一段完整音频（需在事件循环中调用，模型池需已 start()）"""
+        if self._executor is None:
+            raise RuntimeError("本地ASR模型池未启动")
+
+        self._stats['requests'] += 1
+        self._in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, _transcribe_one, audio, language)
+        except Exception as e:
+            self._stats['errors'] += 1
+            raise RuntimeError(f"本地ASR识别失败: {str(e)}") from e
+        finally:
+            self._in_flight -= 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return dict(self._stats,
+                    model=self.model_size,
+                    workers=self.workers,
+                    in_flight=self._in_flight)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
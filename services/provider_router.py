@@ -0,0 +1,275 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+class ProviderHealth:
+    """单个提供商的滚动延迟/错误统计和熔断状态"""
+
+    def __init__(self, window: int = 100, failure_threshold: int = 3, cooldown: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        # kind ('call' / 'stream') -> 最近成功请求的延迟
+        self.latencies: Dict[str, Deque[float]] = {}
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.window = window
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        # 半开状态下是否已有试探请求在进行
+        self.probing = False
+
+    def record(self, kind: str, latency: float, ok: bool):
+        self.outcomes.append(ok)
+        self.probing = False
+        if ok:
+            self.latencies.setdefault(kind, deque(maxlen=self.window)).append(latency)
+            self.consecutive_failures = 0
+            self.open_until = 0.0
+            return
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.failure_threshold:
+            # 熔断；冷却结束后只放行一个请求试探（半开），再失败则重新熔断
+            self.open_until = time.monotonic() + self.cooldown
+
+    def available(self) -> bool:
+        """未熔断，或冷却已结束且没有试探请求在进行"""
+        if self.consecutive_failures < self.failure_threshold:
+            return True
+        return time.monotonic() >= self.open_until and not self.probing
+
+    def acquire(self) -> bool:
+        """为一次请求放行；半开状态下放行的请求即为试探请求，结束前其余请求继续被拒绝"""
+        if not self.available():
+            return False
+        if self.consecutive_failures >= self.failure_threshold:
+            self.probing = True
+        return True
+
+    def release(self):
+        """试探请求以不计入健康统计的错误结束时，允许下一个请求重新试探"""
+        self.probing = False
+
+    def percentile(self, kind: str, q: float, min_samples: int = 10) -> Optional[float]:
+        samples = self.latencies.get(kind)
+        if not samples or len(samples) < min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def snapshot(self) -> Dict[str, Any]:
+        errors = self.outcomes.count(False)
+        return {
+            'state': 'closed' if self.consecutive_failures < self.failure_threshold
+                     else ('open' if time.monotonic() < self.open_until else 'half_open'),
+            'error_rate': round(errors / len(self.outcomes), 3) if self.outcomes else None,
+            'samples': len(self.outcomes),
+            'latency_ms': {
+                kind: {
+                    'p50': round(self.percentile(kind, 0.5, 1) * 1000, 1),
+                    'p95': round(self.percentile(kind, 0.95, 1) * 1000, 1)
+                }
+                for kind, samples in self.latencies.items() if samples
+            }
+        }
+
+class ProviderRouter:
+    """提供商故障转移与对冲请求
+
+    为每个提供商维护滚动的延迟分位数和错误率；连续失败的提供商被熔断，
+    请求直接转到备用提供商。主请求超过该提供商的 p95 延迟仍未返回时，
+    向备用提供商发送一份对冲请求，取先成功返回的结果。
+    流式请求以首个片段的到达时间作为延迟。
+    """
+
+    def __init__(self, credentials: Optional[Dict[str, Dict[str, str]]] = None,
+                 hedge: bool = True, default_hedge_delay: float = 4.0,
+                 min_hedge_delay: float = 0.5, failure_threshold: int = 3,
+                 cooldown: float = 30.0, max_workers: int = 32):
+        """
+        Args:
+            credentials: 备用提供商的凭据 {provider: {'api_key': ..., 'model': ...}}，
+                请求中带的 fallback 优先
+            hedge: 是否发送对冲请求（否则只在失败/熔断时转移）
+            default_hedge_delay: 样本不足、还算不出 p95 时的对冲等待时间（秒）
+            min_hedge_delay: 对冲等待时间下限（秒）
+            failure_threshold: 连续失败多少次后熔断
+            cooldown: 熔断持续时间（秒）
+            max_workers: 执行上游请求的线程数
+        """
+        self.credentials = credentials or {}
+        self.hedge = hedge
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='llm-route')
+        self._lock = threading.Lock()
+        self._health: Dict[str, ProviderHealth] = {}
+        self._stats = {'requests': 0, 'hedged': 0, 'backup_wins': 0, 'failovers': 0, 'short_circuited': 0}
+
+    def fallback_for(self, provider: str, fallback: Optional[Dict[str, str]] = None,
+                     candidates: Optional[List[str]] = None) -> Optional[Dict[str, str]]:
+        """选出备用提供商及其凭据，没有可用的备用时返回 None"""
+        if fallback and fallback.get('provider') and fallback.get('provider') != provider and fallback.get('api_key'):
+            return fallback
+        for other in candidates or list(self.credentials):
+            credential = self.credentials.get(other)
+            if other != provider and credential and credential.get('api_key') and self._get_health(other).available():
+                return dict(credential, provider=other)
+        return None
+
+    def call(self, attempts: List[Tuple[str, Callable[[], Any]]]) -> Tuple[str, Any]:
+        """
+        按路由策略执行一组等价的调用
+
+        Args:
+            attempts: [(提供商, 无参调用)]，第一个为首选
+
+        Returns:
+            (实际返回结果的提供商, 结果)；全部失败时抛出的异常带有 provider 属性
+        """
+        return self._race(attempts, 'call', lambda provider, fn: fn())
+
+    def stream(self, attempts: List[Tuple[str, Callable[[], Iterator[str]]]]) -> Tuple[str, Iterator[str]]:
+        """流式版本：先拿到首个片段的提供商胜出，返回其完整的片段迭代器"""
+        provider, (first, rest) = self._race(attempts, 'stream', self._open_stream)
+
+        def chained():
+            if first is not None:
+                yield first
+            yield from rest
+        return provider, chained()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, providers={
+                provider: health.snapshot() for provider, health in self._health.items()
+            })
+
+    def _race(self, attempts: List[Tuple[str, Callable]], kind: str,
+              run: Callable[[str, Callable], Any]) -> Tuple[str, Any]:
+        with self._lock:
+            self._stats['requests'] += 1
+        pending = list(attempts)
+        # 首选已熔断（或半开且已有试探请求）且有备用时直接跳过
+        if len(pending) > 1 and not self._acquire(pending[0][0]):
+            logger.warning(f"提供商 {pending[0][0]} 已熔断，直接使用 {pending[1][0]}")
+            self._count('short_circuited')
+            pending.pop(0)
+
+        running: Dict[Future, str] = {}
+        errors: List[Exception] = []
+        primary = pending[0][0]
+
+        def launch():
+            provider, fn = pending.pop(0)
+            future = self._executor.submit(self._timed, provider, kind, run, fn)
+            running[future] = provider
+
+        launch()
+        hedge_at = time.monotonic() + self._hedge_delay(primary, kind)
+        while running:
+            timeout = max(0.0, hedge_at - time.monotonic()) if (pending and self.hedge) else None
+            done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                logger.info(f"{primary} 超过 p95 未返回，向 {pending[0][0]} 发送对冲请求")
+                self._count('hedged')
+                launch()
+                continue
+
+            for future in done:
+                provider = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # 标记出错的提供商，首选被熔断跳过时抛出的是备用的错误
+                    e.provider = provider
+                    errors.append(e)
+                    if pending and not running:
+                        logger.warning(f"提供商 {provider} 调用失败，转移到 {pending[0][0]}: {str(e)}")
+                        self._count('failovers')
+                        launch()
+                    continue
+                if provider != primary:
+                    self._count('backup_wins')
+                # 其余请求无法中途取消，结束后丢弃结果（流式请求会被关闭）
+                for other in running:
+                    other.add_done_callback(self._discard)
+                return provider, result
+        raise errors[0]
+
+    def _timed(self, provider: str, kind: str, run: Callable[[str, Callable], Any], fn: Callable) -> Any:
+        start = time.monotonic()
+        try:
+            result = run(provider, fn)
+        except Exception as e:
+            if self._is_provider_failure(e):
+                self._record(provider, kind, time.monotonic() - start, False)
+            else:
+                self._release(provider)
+            raise
+        self._record(provider, kind, time.monotonic() - start, True)
+        return result
+
+    @staticmethod
+    def _open_stream(provider: str, fn: Callable[[], Iterator[str]]) -> Tuple[Optional[str], Iterator[str]]:
+        """打开流并等到首个片段"""
+        chunks = iter(fn())
+        for first in chunks:
+            return first, chunks
+        return None, iter(())
+
+    @staticmethod
+    def _discard(future: Future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        result = future.result()
+        if isinstance(result, tuple) and len(result) == 2 and hasattr(result[1], 'close'):
+            result[1].close()
+
+    @staticmethod
+    def _is_provider_failure(e: Exception) -> bool:
+        """限流、服务端错误和网络错误计入健康统计；其余 4xx（如 Key 无效）是调用方的问题"""
+        if isinstance(e, requests.exceptions.HTTPError):
+            status = e.response.status_code if e.response is not None else 0
+            return status == 429 or status >= 500
+        return isinstance(e, requests.exceptions.RequestException)
+
+    def _hedge_delay(self, provider: str, kind: str) -> float:
+        with self._lock:
+            p95 = self._get_health(provider).percentile(kind, 0.95)
+        return max(self.min_hedge_delay, p95 if p95 is not None else self.default_hedge_delay)
+
+    def _record(self, provider: str, kind: str, latency: float, ok: bool):
+        with self._lock:
+            health = self._get_health(provider)
+            was_open = time.monotonic() < health.open_until
+            health.record(kind, latency, ok)
+            if not was_open and time.monotonic() < health.open_until:
+                logger.warning(f"提供商 {provider} 连续失败 {health.consecutive_failures} 次，熔断 {self.cooldown} 秒")
+
+    def _acquire(self, provider: str) -> bool:
+        with self._lock:
+            return self._get_health(provider).acquire()
+
+    def _release(self, provider: str):
+        with self._lock:
+            self._get_health(provider).release()
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _get_health(self, provider: str) -> ProviderHealth:
+        health = self._health.get(provider)
+        if health is None:
+            health = self._health.setdefault(
+                provider, ProviderHealth(failure_threshold=self.failure_threshold, cooldown=self.cooldown))
+        return health
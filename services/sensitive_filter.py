@@ -0,0 +1,183 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class SensitiveFilter:
+    """敏感词过滤服务 (Aho-Corasick 多模式匹配)
+
+    词库只在首次加载、set_words() 写入或文件 mtime 变化时重新编译，
+    每次检测只需对文本做一次线性扫描。
+    """
+
+    def __init__(self, words_path: str = 'sensitive_words.json', max_conversations: int = 1000):
+        self.words_path = words_path
+        self.max_conversations = max_conversations
+        self._lock = threading.Lock()
+        # 会话扫描游标: conversation_id -> (已扫描消息数, 已扫描前缀的链式哈希)
+        self._cursors: 'OrderedDict[str, Tuple[int, bytes]]' = OrderedDict()
+        self._cursor_lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        # (词表, goto表, fail表, 输出表) 作为整体替换，保证扫描时读到一致的自动机
+        self._automaton: Tuple[List[str], List[Dict[str, int]], List[int], List[List[int]]] = ([], [{}], [0], [[]])
+        self._refresh_if_changed()
+
+    def get_words(self) -> List[str]:
+        """获取当前敏感词列表"""
+        self._refresh_if_changed()
+        return list(self._automaton[0])
+
+    def set_words(self, words: List[str]):
+        """保存敏感词列表并立即重新编译"""
+        with self._lock:
+            with open(self.words_path, 'w', encoding='utf-8') as f:
+                json.dump({'words': words}, f, ensure_ascii=False)
+            self._compile(words)
+            self._mtime = self._get_mtime()
+
+    def scan(self, text: str) -> List[Dict[str, Any]]:
+        """
+        扫描文本中的全部敏感词
+
+        Returns:
+            命中列表，每项包含 word、start、end（end 不包含）
+        """
+        self._refresh_if_changed()
+        words, goto, fail, output = self._automaton
+        if not words or not text:
+            return []
+
+        hits = []
+        state = 0
+        for pos, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for index in output[state]:
+                word = words[index]
+                hits.append({
+                    'word': word,
+                    'start': pos - len(word) + 1,
+                    'end': pos + 1
+                })
+        return hits
+
+    def find_hit_words(self, text: str) -> List[str]:
+        """返回文本命中的敏感词（去重，按词库顺序）"""
+        hit = {h['word'] for h in self.scan(text)}
+        return [w for w in self._automaton[0] if w in hit]
+
+    def scan_conversation(self, conversation_id: Optional[str],
+                          messages: List[Dict]) -> List[str]:
+        """
+        增量扫描会话，只检测上次请求之后新增的消息
+
+        前端每轮都会重发完整的 messages，这里按 conversation_id 记录已扫描的
+        消息数和前缀哈希；前缀一致时跳过已扫描部分，不一致（如清空、切换历史）
+        时从头扫描。没有 conversation_id 时退化为全量扫描。
+
+        Returns:
+            新增消息中命中的敏感词（去重，按词库顺序）
+        """
+        start, digest = 0, b''
+        if conversation_id:
+            with self._cursor_lock:
+                cursor = self._cursors.get(conversation_id)
+                if cursor is not None:
+                    self._cursors.move_to_end(conversation_id)
+            if cursor is not None and cursor[0] <= len(messages):
+                prefix_digest = b''
+                for message in messages[:cursor[0]]:
+                    prefix_digest = self._chain_digest(prefix_digest, message)
+                if prefix_digest == cursor[1]:
+                    start, digest = cursor
+
+        hit = set()
+        for message in messages[start:]:
+            hit.update(h['word'] for h in self.scan(message.get('content', '')))
+            digest = self._chain_digest(digest, message)
+
+        if conversation_id:
+            with self._cursor_lock:
+                self._cursors[conversation_id] = (len(messages), digest)
+                self._cursors.move_to_end(conversation_id)
+                while len(self._cursors) > self.max_conversations:
+                    self._cursors.popitem(last=False)
+
+        return [w for w in self._automaton[0] if w in hit]
+
+    @staticmethod
+    def _chain_digest(prev: bytes, message: Dict) -> bytes:
+        h = hashlib.sha1(prev)
+        h.update(str(message.get('role', '')).encode('utf-8'))
+        h.update(b'\0')
+        h.update(str(message.get('content', '')).encode('utf-8'))
+        return h.digest()
+
+    def _get_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.words_path).st_mtime
+        except OSError:
+            return None
+
+    def _refresh_if_changed(self):
+        """词库文件 mtime 变化时重新加载"""
+        mtime = self._get_mtime()
+        if mtime == self._mtime:
+            return
+
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            try:
+                with open(self.words_path, 'r', encoding='utf-8') as f:
+                    words = json.load(f).get('words', [])
+            except Exception as e:
+                if mtime is not None:
+                    logger.warning(f"读取敏感词库失败: {str(e)}")
+                words = []
+            self._compile(words)
+            self._mtime = mtime
+
+    def _compile(self, words: List[str]):
+        """编译 Aho-Corasick 自动机"""
+        unique_words = []
+        seen = set()
+        for w in words:
+            if w and w not in seen:
+                seen.add(w)
+                unique_words.append(w)
+
+        goto: List[Dict[str, int]] = [{}]
+        output: List[List[int]] = [[]]
+        for index, word in enumerate(unique_words):
+            state = 0
+            for char in word:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    output.append([])
+                state = next_state
+            output[state].append(index)
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                f = fail[state]
+                while f and char not in goto[f]:
+                    f = fail[f]
+                fail[next_state] = goto[f].get(char, 0)
+                output[next_state] = output[next_state] + output[fail[next_state]]
+
+        self._automaton = (unique_words, goto, fail, output)
+        logger.info(f"敏感词自动机已编译: {len(unique_words)} 个词, {len(goto)} 个状态")
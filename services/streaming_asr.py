@@ -0,0 +1,123 @@
+import io
+import logging
+import math
+import wave
+from array import array
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+def pcm_to_wav(pcm: bytes, sample_rate: int = 16000) -> bytes:
+    """把 16bit 单声道 PCM 包装成 WAV 文件"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+class EnergyVAD:
+    """基于短时能量的语音活动检测
+
+    输入 16bit 单声道小端 PCM，按 frame_ms 分帧计算 RMS；噪声底噪在静音帧上
+    滑动估计，能量超过底噪 threshold_ratio 倍（且不低于 min_rms）视为语音帧。
+    连续 start_ms 语音开始一句话，连续 end_silence_ms 静音结束一句话；
+    句首保留 preroll_ms 的音频，避免吞掉起始辅音。
+    """
+
+    def __init__(self, sample_rate: int = 16000, frame_ms: int = 30,
+                 threshold_ratio: float = 3.0, min_rms: float = 300.0,
+                 start_ms: int = 90, end_silence_ms: int = 600,
+                 preroll_ms: int = 300, max_utterance_ms: int = 30000):
+        self.sample_rate = sample_rate
+        self.frame_bytes = sample_rate * frame_ms // 1000 * 2
+        self.frame_ms = frame_ms
+        self.threshold_ratio = threshold_ratio
+        self.min_rms = min_rms
+        self.start_frames = max(1, start_ms // frame_ms)
+        self.end_frames = max(1, end_silence_ms // frame_ms)
+        self.max_frames = max_utterance_ms // frame_ms
+
+        self._pending = b''
+        self._noise_rms = min_rms / threshold_ratio
+        self._preroll: Deque[bytes] = deque(maxlen=max(1, preroll_ms // frame_ms))
+        self._speech_run = 0
+        self._silence_run = 0
+        self._utterance: List[bytes] = []
+        self._in_speech = False
+
+    @property
+    def in_speech(self) -> bool:
+        return self._in_speech
+
+    def current_audio(self) -> bytes:
+        """当前未结束句子的 PCM"""
+        return b''.join(self._utterance)
+
+    def feed(self, pcm: bytes) -> List[Tuple[str, bytes]]:
+        """
+        喂入一段 PCM，返回期间发生的事件
+
+        Returns:
+            [('start', b''), ('end', 整句PCM), ...]
+        """
+        self._pending += pcm
+        events = []
+        while len(self._pending) >= self.frame_bytes:
+            frame = self._pending[:self.frame_bytes]
+            self._pending = self._pending[self.frame_bytes:]
+            event = self._process_frame(frame)
+            if event:
+                events.append(event)
+        return events
+
+    def flush(self) -> Optional[bytes]:
+        """输入结束，返回未结束句子的 PCM（没有则为 None）"""
+        audio = self.current_audio() + self._pending if self._in_speech else None
+        self._reset()
+        self._pending = b''
+        return audio
+
+    def _process_frame(self, frame: bytes) -> Optional[Tuple[str, bytes]]:
+        rms = self._rms(frame)
+        is_speech = rms >= max(self.min_rms, self._noise_rms * self.threshold_ratio)
+
+        if not self._in_speech:
+            self._preroll.append(frame)
+            if is_speech:
+                self._speech_run += 1
+                if self._speech_run >= self.start_frames:
+                    self._in_speech = True
+                    self._silence_run = 0
+                    self._utterance = list(self._preroll)
+                    self._preroll.clear()
+                    return ('start', b'')
+            else:
+                self._speech_run = 0
+                # 只在静音帧上更新底噪，语音不会把阈值抬高
+                self._noise_rms = 0.95 * self._noise_rms + 0.05 * rms
+            return None
+
+        self._utterance.append(frame)
+        self._silence_run = 0 if is_speech else self._silence_run + 1
+        if self._silence_run >= self.end_frames or len(self._utterance) >= self.max_frames:
+            audio = self.current_audio()
+            self._reset()
+            return ('end', audio)
+        return None
+
+    def _reset(self):
+        self._in_speech = False
+        self._speech_run = 0
+        self._silence_run = 0
+        self._utterance = []
+        self._preroll.clear()
+
+    @staticmethod
+    def _rms(frame: bytes) -> float:
+        samples = array('h', frame)
+        if not samples:
+            return 0.0
+        return math.sqrt(sum(s * s for s in samples) / len(samples))
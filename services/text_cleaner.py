@@ -0,0 +1,166 @@
+import re
+from functools import lru_cache
+from typing import List, NamedTuple, Optional, Tuple
+
+# 各规则按优先级合并成一个正则，一次扫描完成全部清理；
+# space 组把空白折叠为一个空格，其余组整体删除
+_RULES = re.compile(r'''
+    (?=[\s`<A-Za-z0-9._%+-])                                # 只在可能命中的字符处尝试，跳过中文正文
+    (?:
+    (?P<fence>```\w*\n?)                                    # 代码块围栏及语言标记
+  | (?P<backtick>`)                                         # 行内代码的反引号（保留内容）
+  | (?P<url>https?://\S+)
+  | (?P<email>\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b)
+  | (?P<path>\b[A-Za-z]:\\\S*)                              # Windows 路径
+  | (?P<assign>\b[A-Za-z_][\w.-]*=\S+)                       # key=value 参数
+  | (?P<token>\b[A-Za-z0-9]{25,}\b)                         # 极长的字符串（可能是API Key）
+  | (?P<tag><[^>]+>)                                        # HTML 标签
+  | (?P<space>\s+)
+    )
+''', re.X)
+# 清理后过短时的退路：只去掉符号
+_FALLBACK_RULES = re.compile(r'(?P<symbol>[`<>{}\[$]+)|(?P<space>\s+)')
+
+# (输出起点, 输出终点, 原文起点, 原文终点)
+Span = Tuple[int, int, int, int]
+
+class CleanedText(NamedTuple):
+    """清理结果：文本及其与原文的位置映射"""
+    text: str
+    spans: List[Span]
+
+    def to_source(self, start: int, end: int) -> Optional[Tuple[int, int]]:
+        """把清理后文本中的区间映射回原文区间，用于高亮"""
+        hits = [s for s in self.spans if s[0] < end and s[1] > start]
+        if not hits:
+            return None
+        first, last = hits[0], hits[-1]
+        # 一一对应的片段可精确换算，折叠过的空白按整段处理
+        src_start, src_end = first[2], last[3]
+        if first[1] - first[0] == first[3] - first[2]:
+            src_start += max(0, start - first[0])
+        if last[1] - last[0] == last[3] - last[2]:
+            src_end -= max(0, last[1] - end)
+        return src_start, src_end
+
+class TextCleaner:
+    """TTS 文本清理器
+
+    正则在模块加载时编译，清理只做一遍扫描：删除URL、邮箱、路径、
+    参数、长串和标签，去掉代码标记，折叠空白，同时记录保留下来的
+    每一段在原文中的位置。清理后不足 min_chars 个字符时退回到只去掉
+    符号的原文（最多 fallback_chars 个字符）。
+    """
+
+    def __init__(self, min_chars: int = 5, fallback_chars: int = 100,
+                 placeholder: str = '处理完成'):
+        self.min_chars = min_chars
+        self.fallback_chars = fallback_chars
+        self.placeholder = placeholder
+
+    def clean(self, text: str) -> CleanedText:
+        if not text:
+            return CleanedText('', [])
+        result = self._scan(_RULES, text)
+        if len(result.text) >= self.min_chars:
+            return result
+
+        fallback = self._scan(_FALLBACK_RULES, text)
+        if not fallback.text:
+            return CleanedText(self.placeholder, [])
+        return self._truncate(fallback, self.fallback_chars)
+
+    @staticmethod
+    def _scan(pattern: 're.Pattern', text: str) -> CleanedText:
+        parts: List[str] = []
+        spans: List[Span] = []
+        length = 0
+
+        def emit(piece: str, src_start: int, src_end: int):
+            nonlocal length
+            end = length + len(piece)
+            last = spans[-1] if spans else None
+            # 相邻且都是一一对应的片段合并为一段
+            if (last and last[1] == length and last[3] == src_start
+                    and last[1] - last[0] == last[3] - last[2] and len(piece) == src_end - src_start):
+                spans[-1] = (last[0], end, last[2], src_end)
+            else:
+                spans.append((length, end, src_start, src_end))
+            parts.append(piece)
+            length = end
+
+        pos = 0
+        for match in pattern.finditer(text):
+            start = match.start()
+            if start > pos:
+                emit(text[pos:start], pos, start)
+            # 删除的内容两侧可能各有空白，只保留一个空格；开头的空白直接丢弃
+            if match.lastgroup == 'space' and parts and not parts[-1].endswith(' '):
+                emit(' ', start, match.end())
+            pos = match.end()
+        if pos < len(text):
+            emit(text[pos:], pos, len(text))
+
+        if parts and parts[-1].endswith(' '):
+            parts[-1] = parts[-1][:-1]
+            length -= 1
+            s = spans[-1]
+            if s[1] - 1 > s[0]:
+                spans[-1] = (s[0], s[1] - 1, s[2], s[3] - 1 if s[1] - s[0] == s[3] - s[2] else s[3])
+            else:
+                spans.pop()
+        return CleanedText(''.join(parts), spans)
+
+    @staticmethod
+    def _truncate(result: CleanedText, limit: int) -> CleanedText:
+        if len(result.text) <= limit:
+            return result
+        spans = []
+        for out_start, out_end, src_start, src_end in result.spans:
+            if out_start >= limit:
+                break
+            if out_end > limit:
+                src_end = src_start + (limit - out_start) if out_end - out_start == src_end - src_start else src_end
+                out_end = limit
+            spans.append((out_start, out_end, src_start, src_end))
+        return CleanedText(result.text[:limit], spans)
+
+_default_cleaner = TextCleaner()
+
+@lru_cache(maxsize=512)
+def clean_tts_text(text: str) -> CleanedText:
+    """用默认规则清理文本；同一段文本在一次请求中会被计算缓存键、合成等多处使用，结果做了缓存"""
+    return _default_cleaner.clean(text)
+
+if __name__ == '__main__':
+    # 微基准: python -m services.text_cleaner
+    import timeit
+
+    def legacy_clean(text: str) -> str:
+        """旧实现：路由和 TTSService 各自的多遍替换"""
+        text = re.sub(r'https?://[^\s]+', '', text)
+        text = re.sub(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', '', text)
+        text = re.sub(r'\b[A-Za-z0-9]{25,}\b', '', text)
+        text = re.sub(r'\s+', ' ', text).strip()
+        text = re.sub(r'https?://[^\s]+', '', text)
+        text = re.sub(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', '', text)
+        text = re.sub(r'[A-Za-z]:\$^\s]*', '', text)
+        text = re.sub(r'\b[A-Za-z0-9]{30,}\b', '', text)
+        text = re.sub(r'\b\w+=[^\s]+', '', text)
+        text = re.sub(r'<[^>]+>', '', text)
+        text = re.sub(r'```[\w]*\n?', '', text)
+        text = re.sub(r'`([^`]*)`', r'\1', text)
+        return re.sub(r'\s+', ' ', text).strip()
+
+    samples = {
+        'short': '你好呀，今天想聊点什么？',
+        'mixed': '可以参考 https://example.com/docs?id=1 或者发邮件到 help@example.com，'
+                 '配置写成 `timeout=30`，文件在 C:\\Users\\demo\\a.txt 里。' * 4,
+        'long': '这是一段比较长的回答，包含很多句子。' * 60
+    }
+    cleaner = TextCleaner()
+    for name, sample in samples.items():
+        runs = 2000
+        legacy = timeit.timeit(lambda: legacy_clean(sample), number=runs) / runs * 1e6
+        fused = timeit.timeit(lambda: cleaner.clean(sample), number=runs) / runs * 1e6
+        print(f"{name:6} {len(sample):5} 字符  旧实现 {legacy:8.1f} us/次  单遍 {fused:8.1f} us/次")
@@ -0,0 +1,228 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class TTSCache:
+    """TTS音频缓存 (内存LRU + 磁盘两级)
+
+    以 (清理后文本, 引擎, 声音, 语速, 音量) 的哈希为键。小音频同时放在内存
+    LRU 中，所有音频写入磁盘目录；两级都按字节数上限淘汰最久未使用的条目。
+    音频可以附带口型时间轴 (JSON)，与音频同键存放（磁盘上为同名 .json 文件），
+    随音频一起淘汰。固定短语等预热音频可以 pin() 常驻内存，不参与淘汰。
+    """
+
+    def __init__(self, cache_dir: str = 'tts_cache',
+                 memory_max_bytes: int = 16 * 1024 * 1024,
+                 memory_item_max_bytes: int = 256 * 1024,
+                 disk_max_bytes: int = 256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.memory_max_bytes = memory_max_bytes
+        self.memory_item_max_bytes = memory_item_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+
+        self._lock = threading.Lock()
+        # 内存和 pin 的条目为 (音频, 时间轴)；磁盘只记录两个文件的总字节数
+        self._memory: 'OrderedDict[str, Tuple[bytes, Optional[bytes]]]' = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: 'OrderedDict[str, int]' = OrderedDict()
+        self._disk_bytes = 0
+        self._pinned: Dict[str, Tuple[bytes, Optional[bytes]]] = {}
+        self._stats = {'pinned_hits': 0, 'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+
+        self._load_disk_index()
+
+    @staticmethod
+    def make_key(text: str, engine: str, voice: str, rate: float, volume: float) -> str:
+        """生成缓存键（同时用作 ETag）"""
+        raw = '\0'.join([text, engine, voice, f'{rate:.2f}', f'{volume:.2f}'])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self._lookup(key)
+        return entry[0] if entry else None
+
+    def get_timing(self, key: str) -> Optional[bytes]:
+        """音频附带的口型时间轴，没有时返回 None"""
+        entry = self._lookup(key, count=False)
+        return entry[1] if entry else None
+
+    def put(self, key: str, data: bytes, timing: Optional[bytes] = None):
+        if not data:
+            return
+        with self._lock:
+            self._remember(key, (data, timing))
+            if key in self._disk:
+                return
+
+        try:
+            self._write_file(self._path(key), data)
+            if timing:
+                self._write_file(self._timing_path(key), timing)
+        except OSError as e:
+            logger.warning(f"写入TTS磁盘缓存失败: {str(e)}")
+            self._unlink(key)
+            return
+
+        size = len(data) + len(timing or b'')
+        with self._lock:
+            if key not in self._disk:
+                self._disk[key] = size
+                self._disk_bytes += size
+            evicted = []
+            while self._disk_bytes > self.disk_max_bytes and len(self._disk) > 1:
+                old_key, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                evicted.append(old_key)
+
+        for old_key in evicted:
+            self._unlink(old_key)
+
+    def pin(self, key: str, data: bytes, timing: Optional[bytes] = None):
+        """常驻内存（不计入LRU容量，不会被淘汰）"""
+        if not data:
+            return
+        with self._lock:
+            self._pinned[key] = (data, timing)
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_bytes -= self._entry_size(old)
+
+    def is_pinned(self, key: str) -> bool:
+        with self._lock:
+            return key in self._pinned
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = sum(self._stats.values())
+            hits = lookups - self._stats['misses']
+            return dict(self._stats,
+                        hit_ratio=round(hits / lookups, 3) if lookups else None,
+                        pinned_entries=len(self._pinned),
+                        pinned_bytes=sum(self._entry_size(entry) for entry in self._pinned.values()),
+                        memory_entries=len(self._memory),
+                        memory_bytes=self._memory_bytes,
+                        disk_entries=len(self._disk),
+                        disk_bytes=self._disk_bytes)
+
+    def _lookup(self, key: str, count: bool = True) -> Optional[Tuple[bytes, Optional[bytes]]]:
+        """按 pin、内存、磁盘的顺序查找 (音频, 时间轴)"""
+        with self._lock:
+            entry = self._pinned.get(key)
+            if entry is not None:
+                if count:
+                    self._stats['pinned_hits'] += 1
+                return entry
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                if count:
+                    self._stats['memory_hits'] += 1
+                return entry
+            on_disk = key in self._disk
+
+        if on_disk:
+            try:
+                with open(self._path(key), 'rb') as f:
+                    data = f.read()
+                os.utime(self._path(key))
+            except OSError:
+                data = None
+            timing = None
+            if data is not None:
+                try:
+                    with open(self._timing_path(key), 'rb') as f:
+                        timing = f.read()
+                except OSError:
+                    pass
+            with self._lock:
+                if data is not None:
+                    self._disk.move_to_end(key)
+                    self._remember(key, (data, timing))
+                    if count:
+                        self._stats['disk_hits'] += 1
+                    return data, timing
+                self._forget_disk(key)
+
+        if count:
+            with self._lock:
+                self._stats['misses'] += 1
+        return None
+
+    def _remember(self, key: str, entry: Tuple[bytes, Optional[bytes]]):
+        """放入内存LRU（需持有锁）"""
+        size = self._entry_size(entry)
+        if size > self.memory_item_max_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= self._entry_size(old)
+        self._memory[key] = entry
+        self._memory_bytes += size
+        while self._memory_bytes > self.memory_max_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= self._entry_size(evicted)
+
+    @staticmethod
+    def _entry_size(entry: Tuple[bytes, Optional[bytes]]) -> int:
+        return len(entry[0]) + len(entry[1] or b'')
+
+    @staticmethod
+    def _write_file(path: str, data: bytes):
+        temp_path = f'{path}.{threading.get_ident()}.tmp'
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def _unlink(self, key: str):
+        for path in (self._path(key), self._timing_path(key)):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def _forget_disk(self, key: str):
+        size = self._disk.pop(key, None)
+        if size is not None:
+            self._disk_bytes -= size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f'{key}.mp3')
+
+    def _timing_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f'{key}.json')
+
+    def _load_disk_index(self):
+        """启动时扫描磁盘缓存目录，按修改时间恢复LRU顺序"""
+        entries = []
+        timing_sizes: Dict[str, int] = {}
+        if os.path.isdir(self.cache_dir):
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    path = os.path.join(root, name)
+                    if name.endswith('.tmp'):
+                        os.unlink(path)
+                        continue
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    if name.endswith('.mp3'):
+                        entries.append((stat.st_mtime, name[:-4], stat.st_size))
+                    elif name.endswith('.json'):
+                        timing_sizes[name[:-5]] = stat.st_size
+
+        # 没有对应音频的时间轴文件（如音频写入失败）直接删除
+        for key in set(timing_sizes) - {key for _, key, _ in entries}:
+            self._unlink(key)
+        for _, key, size in sorted(entries):
+            size += timing_sizes.get(key, 0)
+            self._disk[key] = size
+            self._disk_bytes += size
+        if entries:
+            logger.info(f"TTS磁盘缓存已加载: {len(entries)} 条, {self._disk_bytes} bytes")
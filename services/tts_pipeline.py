@@ -0,0 +1,145 @@
+import logging
+import re
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 句末标点（中英文），可带后引号/括号
+_SENTENCE_END = re.compile(r'(?:[。！？!?；;…]+|\.(?!\d))["\'”’」』）)]*|\n+')
+# 过长句子的次级断点
+_SOFT_BREAK = re.compile(r'[，,、：:—]')
+# 至少包含一个可朗读的字符（中文、字母或数字）
+_SPEAKABLE = re.compile(r'[一-鿿\w]')
+
+class SentenceSplitter:
+    """增量分句器
+
+    逐段喂入流式文本，按中英文句末标点切出完整句子；过短的句子与下一句合并，
+    过长且没有句末标点的文本在逗号等次级断点处切开。
+    """
+
+    def __init__(self, min_chars: int = 4, max_chars: int = 80):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self._buffer = ''
+
+    def feed(self, text: str) -> List[str]:
+        """喂入一段文本，返回其中已完整的句子"""
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(self._buffer):
+            end = match.end()
+            # 缓冲区末尾的 "." 可能是小数点或缩写，等待后续文本再判断
+            if end == len(self._buffer) and match.group().startswith('.'):
+                break
+            if len(self._buffer[start:end].strip()) < self.min_chars:
+                continue
+            sentences.append(self._buffer[start:end])
+            start = end
+        self._buffer = self._buffer[start:]
+
+        while len(self._buffer) > self.max_chars:
+            cut = None
+            for match in _SOFT_BREAK.finditer(self._buffer, self.min_chars, self.max_chars):
+                cut = match.end()
+            if cut is None:
+                cut = self.max_chars
+            sentences.append(self._buffer[:cut])
+            self._buffer = self._buffer[cut:]
+
+        return [s.strip() for s in sentences if _SPEAKABLE.search(s)]
+
+    def flush(self) -> List[str]:
+        """返回缓冲区中剩余的文本"""
+        rest, self._buffer = self._buffer.strip(), ''
+        return [rest] if rest and _SPEAKABLE.search(rest) else []
+
+def split_sentences(text: str, min_chars: int = 4, max_chars: int = 80) -> List[str]:
+    """把完整文本切分为句子"""
+    splitter = SentenceSplitter(min_chars, max_chars)
+    return splitter.feed(text) + splitter.flush()
+
+class TTSPipeline:
+    """边生成边合成的语音流水线
+
+    把流式回复按句切分，每句提交给 TTSService 并发合成（单次运行最多
+    max_in_flight 句同时在合成），按原句顺序产出音频，第一句合成完即可播放。
+    """
+
+    def __init__(self, tts_service, runner, max_in_flight: int = 3):
+        """
+        Args:
+            tts_service: TTSService 实例
+            runner: 运行合成协程的 AsyncRunner
+            max_in_flight: 单次运行中同时合成的句子数上限
+        """
+        self.tts_service = tts_service
+        self.runner = runner
+        self.max_in_flight = max_in_flight
+
+    def run(self, chunks: Iterable[str], engine: str = 'edge',
+            voice: str = 'zh-CN-XiaoxiaoNeural', rate: float = 1.0,
+            volume: float = 1.0) -> Iterator[Dict[str, Any]]:
+        """
+        运行流水线
+
+        Args:
+            chunks: 流式文本片段（如 LLMService.stream_llm 的输出）
+
+        Yields:
+            {'type': 'token', 'content': 片段} —— 原样转发每个输入片段
+            {'type': 'audio', 'index': 序号, 'text': 句子, 'audio': MP3字节,
+             'words': [[起始毫秒, 时长毫秒, 词], ...]} —— 按句子顺序，words 用于口型同步
+        """
+        splitter = SentenceSplitter()
+        waiting: Deque[str] = deque()
+        in_flight: Deque[Tuple[int, str, Future]] = deque()
+        next_index = 0
+
+        def pump():
+            nonlocal next_index
+            while waiting and len(in_flight) < self.max_in_flight:
+                sentence = waiting.popleft()
+                in_flight.append((next_index, sentence, self._submit(sentence, engine, voice, rate, volume)))
+                next_index += 1
+
+        def pop_ready(block: bool):
+            while in_flight and (block or in_flight[0][2].done()):
+                index, sentence, future = in_flight.popleft()
+                pump()
+                event = self._audio_event(index, sentence, future)
+                if event:
+                    yield event
+
+        try:
+            for chunk in chunks:
+                waiting.extend(splitter.feed(chunk))
+                pump()
+                yield {'type': 'token', 'content': chunk}
+                yield from pop_ready(block=False)
+
+            waiting.extend(splitter.flush())
+            pump()
+            yield from pop_ready(block=True)
+        finally:
+            for _, _, future in in_flight:
+                future.cancel()
+
+    def _submit(self, sentence: str, engine: str, voice: str, rate: float, volume: float) -> Future:
+        return self.runner.submit(self.tts_service.synthesize_with_timing(
+            text=sentence, engine=engine, voice=voice, rate=rate, volume=volume
+        ))
+
+    def _audio_event(self, index: int, sentence: str, future: Future) -> Optional[Dict[str, Any]]:
+        try:
+            audio, words = future.result()
+        except Exception as e:
+            # 单句合成失败不影响后续句子
+            logger.error(f"流水线TTS合成失败 [{index}]: {str(e)}")
+            return None
+        if not audio:
+            return None
+        return {'type': 'audio', 'index': index, 'text': sentence, 'audio': audio, 'words': words}
@@ -1,21 +1,49 @@
 import edge_tts
 import asyncio
+import json
 import tempfile
 import os
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, AsyncIterator, List, Tuple
+
+from .tts_cache import TTSCache
+from .text_cleaner import CleanedText, clean_tts_text
+from .tts_pipeline import split_sentences
 
 logger = logging.getLogger(__name__)
 
+# MPEG Layer III 码率表 (kbps)，[MPEG2/2.5, MPEG1]
+_MP3_BITRATES = (
+    (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+)
+# 采样率表，按帧头版本位索引: 0 MPEG2.5, 2 MPEG2, 3 MPEG1
+_MP3_SAMPLE_RATES = {0: (11025, 12000, 8000), 2: (22050, 24000, 16000), 3: (44100, 48000, 32000)}
+
 class TTSService:
     """语音合成服务"""
     
-    def __init__(self):
+    def __init__(self, cache: Optional[TTSCache] = None, chunk_chars: int = 200,
+                 max_parallel_chunks: int = 4):
+        """
+        Args:
+            cache: 音频缓存
+            chunk_chars: 长文本按句切分后每段的最大字符数
+            max_parallel_chunks: 长文本同时合成的段数上限
+        """
+        self.cache = cache
+        self.chunk_chars = chunk_chars
+        self.max_parallel_chunks = max(1, max_parallel_chunks)
         self.supported_engines = {
             'edge': self._generate_edge_tts,
             'azure': self._generate_azure_tts
         }
         
+        # 支持边合成边输出的引擎
+        self.streaming_engines = {
+            'edge': self._stream_edge_tts
+        }
+        
         # Edge TTS支持的声音列表
         self.edge_voices = {
             'zh-CN-XiaoxiaoNeural': '晓晓 (女声)',
@@ -42,6 +70,16 @@ class TTSService:
             'zh-CN-YunzeNeural': '云泽 (男声)'
         }
     
+    def cache_key(self, text: str, engine: str, voice: str, rate: float, volume: float) -> str:
+        """按清理后的文本计算音频缓存键，同一结果也用作HTTP ETag"""
+        return TTSCache.make_key(self._clean_text_for_tts(text), engine, voice, rate, volume)
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """获取TTS运行统计"""
+        return {
+            'cache': self.cache.get_metrics() if self.cache else None
+        }
+    
     def get_supported_engines(self) -> Dict[str, str]:
         """获取支持的TTS引擎列表"""
         return {
@@ -90,6 +128,251 @@ class TTSService:
             logger.error(f"TTS生成失败 [{engine}]: {str(e)}")
             raise
     
+    async def synthesize(self, text: str, engine: str = 'edge',
+                         voice: str = 'zh-CN-XiaoxiaoNeural',
+                         rate: float = 1.0, volume: float = 1.0,
+                         **kwargs) -> bytes:
+        """
+        生成语音并直接返回音频数据
+        
+        Returns:
+            MP3音频字节，文本清理后为空时返回 b''
+        """
+        if engine in self.streaming_engines:
+            chunks = [chunk async for chunk in self.stream_speech(text, engine, voice, rate, volume, **kwargs)]
+            return b''.join(chunks)
+        
+        audio_path = await self.generate_speech(text, engine, voice, rate, volume, **kwargs)
+        if not audio_path:
+            return b''
+        try:
+            with open(audio_path, 'rb') as f:
+                return f.read()
+        finally:
+            os.unlink(audio_path)
+    
+    async def synthesize_with_timing(self, text: str, engine: str = 'edge',
+                                     voice: str = 'zh-CN-XiaoxiaoNeural',
+                                     rate: float = 1.0, volume: float = 1.0,
+                                     **kwargs) -> Tuple[bytes, List[list]]:
+        """
+        生成语音及口型时间轴
+        
+        Returns:
+            (MP3音频字节, [[起始毫秒, 时长毫秒, 文本], ...])；不支持流式的引擎时间轴为空
+        """
+        if engine not in self.streaming_engines:
+            return await self.synthesize(text, engine, voice, rate, volume, **kwargs), []
+        
+        chunks, words = [], []
+        async for event in self.stream_speech_events(text, engine, voice, rate, volume, **kwargs):
+            if event['type'] == 'audio':
+                chunks.append(event['data'])
+            else:
+                words.extend(event['words'])
+        return b''.join(chunks), words
+    
+    async def stream_speech(self, text: str, engine: str = 'edge',
+                            voice: str = 'zh-CN-XiaoxiaoNeural',
+                            rate: float = 1.0, volume: float = 1.0,
+                            **kwargs) -> AsyncIterator[bytes]:
+        """
+        流式生成语音，不落盘，边合成边产出MP3数据块
+        
+        Args:
+            text: 要合成的文本
+            engine: TTS引擎（需在 streaming_engines 中）
+            voice: 声音名称
+            rate: 语速 (0.5-2.0)
+            volume: 音量 (0.0-1.0)
+        """
+        async for event in self.stream_speech_events(text, engine, voice, rate, volume, **kwargs):
+            if event['type'] == 'audio':
+                yield event['data']
+    
+    async def stream_speech_events(self, text: str, engine: str = 'edge',
+                                   voice: str = 'zh-CN-XiaoxiaoNeural',
+                                   rate: float = 1.0, volume: float = 1.0,
+                                   **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式生成语音，同时产出词边界时间轴（用于口型同步）
+        
+        Yields:
+            {'type': 'audio', 'data': MP3数据块}
+            {'type': 'words', 'words': [[起始毫秒, 时长毫秒, 文本], ...]} —— 紧跟在对应的音频之后
+        """
+        if engine not in self.streaming_engines:
+            raise ValueError(f"TTS引擎不支持流式合成: {engine}")
+        
+        if not text.strip():
+            raise ValueError("文本不能为空")
+        
+        key = None
+        if self.cache:
+            key = self.cache_key(text, engine, voice, rate, volume)
+            cached = self.cache.get(key)
+            if cached:
+                logger.debug(f"TTS缓存命中: {key[:12]}")
+                timing = self.cache.get_timing(key)
+                yield {'type': 'audio', 'data': cached}
+                yield {'type': 'words', 'words': json.loads(timing) if timing else []}
+                return
+        
+        chunks, words = [], []
+        try:
+            async for event in self.streaming_engines[engine](text, voice, rate, volume, **kwargs):
+                if event['type'] == 'audio':
+                    chunks.append(event['data'])
+                else:
+                    words.extend(event['words'])
+                yield event
+        except Exception as e:
+            logger.error(f"TTS流式生成失败 [{engine}]: {str(e)}")
+            raise
+        
+        # 完整合成后才写入缓存，中途断开的流不会留下残缺音频
+        if key:
+            self.cache.put(key, b''.join(chunks), timing=json.dumps(words, ensure_ascii=False).encode('utf-8'))
+    
+    async def _stream_edge_tts(self, text: str, voice: str, rate: float,
+                               volume: float, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """使用Edge TTS流式生成语音，长文本分段并行合成"""
+        cleaned_text = self._clean_text_for_tts(text)
+        if not cleaned_text:
+            logger.warning("清理后的TTS文本为空，跳过语音合成。")
+            return
+        
+        chunks = self._split_for_tts(cleaned_text)
+        if len(chunks) == 1:
+            async for event in self._stream_edge_chunk(cleaned_text, voice, rate, volume):
+                yield event
+            return
+        
+        # 第一段边合成边输出，其余各段同时在后台合成（受并发上限约束），
+        # 按顺序拼接；总耗时取决于最慢的一段而不是全文长度
+        logger.info(f"Edge TTS长文本分段合成: {len(cleaned_text)} 字符, {len(chunks)} 段")
+        semaphore = asyncio.Semaphore(self.max_parallel_chunks)
+        
+        async def collect(chunk: str) -> Tuple[bytes, List[list]]:
+            async with semaphore:
+                audio, words = [], []
+                async for event in self._stream_edge_chunk(chunk, voice, rate, volume):
+                    if event['type'] == 'audio':
+                        audio.append(event['data'])
+                    else:
+                        words.extend(event['words'])
+                return b''.join(audio), words
+        
+        first = []
+        async with semaphore:
+            tasks = [asyncio.ensure_future(collect(chunk)) for chunk in chunks[1:]]
+            try:
+                async for event in self._stream_edge_chunk(chunks[0], voice, rate, volume):
+                    if event['type'] == 'audio':
+                        first.append(event['data'])
+                    yield event
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                raise
+        # 后续各段的词边界要加上前面音频的时长
+        elapsed = self._mp3_duration_ms(b''.join(first))
+        try:
+            for task in tasks:
+                audio, words = await task
+                # Edge 输出的是裸 MP3 帧，可以直接拼接；去掉可能存在的 ID3 头
+                audio = self._strip_id3(audio)
+                yield {'type': 'audio', 'data': audio}
+                yield {'type': 'words', 'words': [[start + elapsed, duration, word] for start, duration, word in words]}
+                elapsed += self._mp3_duration_ms(audio)
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def _stream_edge_chunk(self, cleaned_text: str, voice: str, rate: float,
+                                 volume: float) -> AsyncIterator[Dict[str, Any]]:
+        """合成一段已清理的文本，音频块之后附带这一段的词边界"""
+        rate_str, volume_str = self._edge_prosody(rate, volume)
+        max_retries = 2
+        
+        for attempt in range(max_retries):
+            total_bytes = 0
+            words = []
+            try:
+                logger.debug(f"Edge TTS流式尝试 {attempt + 1}/{max_retries}: voice={voice}, rate={rate_str}, volume={volume_str}")
+                communicate = edge_tts.Communicate(cleaned_text, voice, rate=rate_str, volume=volume_str)
+                async for chunk in communicate.stream():
+                    if chunk['type'] == 'audio' and chunk['data']:
+                        total_bytes += len(chunk['data'])
+                        yield {'type': 'audio', 'data': chunk['data']}
+                    elif chunk['type'] == 'WordBoundary':
+                        # Edge 的时间单位是 100 纳秒
+                        words.append([chunk['offset'] // 10000, chunk['duration'] // 10000, chunk['text']])
+                
+                if total_bytes == 0:
+                    raise ValueError("Edge TTS未返回音频数据，可能合成失败。")
+                logger.info(f"Edge TTS流式生成成功: {len(cleaned_text)} 字符, 音频大小: {total_bytes} bytes")
+                yield {'type': 'words', 'words': words}
+                return
+                
+            except Exception as e:
+                logger.error(f"Edge TTS流式尝试 {attempt + 1}/{max_retries} 失败: {str(e)}")
+                # 已经输出过音频的流无法重来，只能在首字节之前重试
+                if total_bytes > 0 or attempt == max_retries - 1:
+                    raise
+                await asyncio.sleep(1)
+    
+    def _split_for_tts(self, text: str) -> List[str]:
+        """在句末（过长时在逗号等停顿处）把长文本切成不超过 chunk_chars 的段"""
+        if len(text) <= self.chunk_chars:
+            return [text]
+        chunks = []
+        current = ''
+        for sentence in split_sentences(text, max_chars=self.chunk_chars):
+            if current and len(current) + len(sentence) + 1 > self.chunk_chars:
+                chunks.append(current)
+                current = sentence
+            else:
+                current = f"{current} {sentence}" if current else sentence
+        if current:
+            chunks.append(current)
+        return chunks or [text]
+    
+    @staticmethod
+    def _strip_id3(data: bytes) -> bytes:
+        """去掉 MP3 开头的 ID3v2 标签，拼接时只保留音频帧"""
+        if len(data) >= 10 and data[:3] == b'ID3':
+            size = (data[6] & 0x7f) << 21 | (data[7] & 0x7f) << 14 | (data[8] & 0x7f) << 7 | (data[9] & 0x7f)
+            return data[10 + size:]
+        return data
+    
+    @classmethod
+    def _mp3_duration_ms(cls, data: bytes) -> int:
+        """按帧头累计 MP3 时长（毫秒），不需要解码"""
+        data = cls._strip_id3(data)
+        pos, duration = 0, 0.0
+        while pos + 4 <= len(data):
+            header = data[pos + 1]
+            version = (header >> 3) & 3  # 3: MPEG1, 2: MPEG2, 0: MPEG2.5
+            bitrate_index = data[pos + 2] >> 4
+            rate_index = (data[pos + 2] >> 2) & 3
+            if (data[pos] != 0xFF or header & 0xE0 != 0xE0 or version == 1 or (header >> 1) & 3 != 1
+                    or bitrate_index in (0, 15) or rate_index == 3):
+                pos += 1
+                continue
+            bitrate = _MP3_BITRATES[version == 3][bitrate_index] * 1000
+            sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+            samples = 1152 if version == 3 else 576
+            pos += samples // 8 * bitrate // sample_rate + ((data[pos + 2] >> 1) & 1)
+            duration += samples * 1000 / sample_rate
+        return round(duration)
+    
+    def _edge_prosody(self, rate: float, volume: float):
+        """把语速、音量倍率转换为Edge TTS的百分比参数"""
+        rate_percent = int((rate - 1) * 100)
+        volume_percent = int((volume - 1) * 100)
+        return f"{rate_percent:+d}%", f"{volume_percent:+d}%"
+    
     async def _generate_edge_tts(self, text: str, voice: str, rate: float, 
                                volume: float, **kwargs) -> str:
         """使用Edge TTS生成语音"""
@@ -106,22 +389,24 @@ class TTSService:
                     return "" # 返回空字符串，表示没有生成音频，但不算作错误
 
                 # 处理语速和音量参数
-                rate_percent = int((rate - 1) * 100)
-                rate_str = f"{rate_percent:+d}%"
-                volume_percent = int((volume - 1) * 100)
-                volume_str = f"{volume_percent:+d}%"
+                rate_str, volume_str = self._edge_prosody(rate, volume)
 
                 logger.debug(f"Edge TTS尝试 {attempt + 1}/{max_retries}: voice={voice}, rate={rate_str}, volume={volume_str}")
                 
-                communicate = edge_tts.Communicate(cleaned_text, voice, rate=rate_str, volume=volume_str)
-                
                 # 创建临时文件
                 temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
                 temp_path = temp_file.name
                 temp_file.close()
                 
-                # 保存音频
-                await communicate.save(temp_path)
+                # 保存音频；长文本走分段并行合成
+                if len(cleaned_text) > self.chunk_chars:
+                    with open(temp_path, 'wb') as f:
+                        async for event in self._stream_edge_tts(cleaned_text, voice, rate, volume):
+                            if event['type'] == 'audio':
+                                f.write(event['data'])
+                else:
+                    communicate = edge_tts.Communicate(cleaned_text, voice, rate=rate_str, volume=volume_str)
+                    await communicate.save(temp_path)
                 
                 # 检查文件大小
                 file_size = os.path.getsize(temp_path)
@@ -153,33 +438,10 @@ class TTSService:
     
     def _clean_text_for_tts(self, text: str) -> str:
         """清理文本，移除TTS不需要的内容"""
-        import re
-        
         if not text:
             return ""
         
-        original_text = text
-        text = re.sub(r'https?://[^\s]+', '', text)
-        text = re.sub(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', '', text)
-        text = re.sub(r'[A-Za-z]:\$^\s]*', '', text)
-        text = re.sub(r'\b[A-Za-z0-9]{30,}\b', '', text)
-        text = re.sub(r'\b\w+=[^\s]+', '', text)
-        text = re.sub(r'<[^>]+>', '', text)
-        text = re.sub(r'```[\w]*\n?', '', text)
-        text = re.sub(r'`([^`]*)`', r'\1', text)
-        text = re.sub(r'\s+', ' ', text)
-        text = text.strip()
-        
-        if len(text) < 5:
-            fallback_text = re.sub(r'[`<>{}[$]+', '', original_text)
-            fallback_text = re.sub(r'\s+', ' ', fallback_text).strip()
-            text = fallback_text[:100] if len(fallback_text) > 0 else "处理完成"
-        
-        if len(text) > 200:
-            text = text[:200] + "..."
-        
-        logger.debug(f"TTS文本清理: 原长度={len(original_text)}, 清理后长度={len(text)}")
-        return text
+        return clean_tts_text(text).text
     
     def validate_config(self, engine: str, voice: str, rate: float, 
                        volume: float) -> Dict[str, Any]:
@@ -207,7 +469,7 @@ class TTSService:
         
         return validation_result
     
-    def preview_tts_text(self, text: str) -> str:
-        """预览将要合成的文本（已清理）"""
-        return self._clean_text_for_tts(text)
+    def preview_tts_text(self, text: str) -> CleanedText:
+        """预览将要合成的文本（已清理），附带与原文的位置映射"""
+        return clean_tts_text(text)
 
@@ -0,0 +1,127 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 前端会原样朗读的固定短语：清理后为空时的占位文本和时长提醒（见 time_countdown.js）
+DEFAULT_PHRASES = (
+    '处理完成',
+    '今日可用时长还剩5分钟。',
+    '今日可用时长还剩1分钟。',
+    '今日可用时长已用尽，请明天再来。'
+)
+
+class TTSWarmup:
+    """固定短语预合成
+
+    为正在使用的每种声音配置（声音、语速、音量）在后台事件循环中预先
+    合成固定短语，结果 pin 在 TTSCache 内存中，之后的请求直接命中缓存。
+    启动时只预热配置的声音，请求中出现新的声音配置时再补充预热；
+    预热不阻塞启动，也不阻塞请求。
+    """
+
+    def __init__(self, tts_service, runner, phrases: Iterable[str] = DEFAULT_PHRASES,
+                 voices: Iterable[str] = ('zh-CN-XiaoxiaoNeural',), engine: str = 'edge',
+                 max_profiles: int = 8, concurrency: int = 2):
+        """
+        Args:
+            tts_service: TTSService 实例（需配置 cache）
+            runner: 运行合成协程的 AsyncRunner
+            phrases: 需要预合成的短语
+            voices: 启动时预热的声音
+            engine: 使用的TTS引擎
+            max_profiles: 最多预热的声音配置数，限制常驻内存
+            concurrency: 同时合成的短语数
+        """
+        self.tts_service = tts_service
+        self.runner = runner
+        self.phrases = [p for p in dict.fromkeys(phrases) if p and p.strip()]
+        self.voices = list(voices)
+        self.engine = engine
+        self.max_profiles = max_profiles
+        self.concurrency = concurrency
+
+        self._lock = threading.Lock()
+        self._profiles: Dict[Tuple[str, float, float], str] = {}
+        self._stats = {'warmed': 0, 'failed': 0}
+
+    @staticmethod
+    def load_phrases(path: Optional[str]) -> List[str]:
+        """从 JSON 文件（字符串数组）读取短语，文件不存在或无效时使用默认短语"""
+        if not path:
+            return list(DEFAULT_PHRASES)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                phrases = json.load(f)
+            if isinstance(phrases, list) and all(isinstance(p, str) for p in phrases):
+                return phrases
+            logger.warning(f"TTS预热短语文件格式错误（应为字符串数组）: {path}")
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取TTS预热短语失败: {str(e)}")
+        return list(DEFAULT_PHRASES)
+
+    def start(self):
+        """后台预热启动时配置的声音，立即返回"""
+        for voice in self.voices:
+            self.ensure_voice(voice)
+
+    def ensure_voice(self, voice: str, rate: float = 1.0, volume: float = 1.0,
+                     engine: Optional[str] = None):
+        """声音配置首次出现时安排预热"""
+        if self.tts_service.cache is None or not self.phrases:
+            return
+        if engine is not None and engine != self.engine:
+            return
+        if voice not in self.tts_service.get_voices(self.engine):
+            return
+        profile = (voice, round(float(rate), 2), round(float(volume), 2))
+        with self._lock:
+            if profile in self._profiles or len(self._profiles) >= self.max_profiles:
+                return
+            self._profiles[profile] = 'warming'
+        self.runner.submit(self._warm(profile))
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, phrases=len(self.phrases), profiles=[
+                {'voice': voice, 'rate': rate, 'volume': volume, 'state': state}
+                for (voice, rate, volume), state in self._profiles.items()
+            ])
+
+    async def _warm(self, profile: Tuple[str, float, float]):
+        voice, rate, volume = profile
+        start = time.monotonic()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def warm_phrase(phrase: str) -> bool:
+            async with semaphore:
+                return await self._warm_phrase(phrase, voice, rate, volume)
+
+        results = await asyncio.gather(*(warm_phrase(p) for p in self.phrases))
+        with self._lock:
+            self._profiles[profile] = 'ready' if all(results) else 'partial'
+        logger.info(f"TTS短语预热完成: voice={voice}, rate={rate}, volume={volume}, "
+                    f"{sum(results)}/{len(results)} 条, 耗时 {time.monotonic() - start:.1f}s")
+
+    async def _warm_phrase(self, phrase: str, voice: str, rate: float, volume: float) -> bool:
+        cache = self.tts_service.cache
+        key = self.tts_service.cache_key(phrase, self.engine, voice, rate, volume)
+        if cache.is_pinned(key):
+            return True
+        try:
+            # 磁盘缓存中已有时 synthesize 直接读缓存，不会请求Edge
+            data = await self.tts_service.synthesize(phrase, self.engine, voice, rate, volume)
+        except Exception as e:
+            logger.warning(f"TTS短语预热失败 '{phrase}' [{voice}]: {str(e)}")
+            data = b''
+        with self._lock:
+            self._stats['warmed' if data else 'failed'] += 1
+        if not data:
+            return False
+        # 口型时间轴随音频一起写入缓存，一并常驻
+        cache.pin(key, data, cache.get_timing(key))
+        return True
@@ -0,0 +1,167 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class UsageTracker:
+    """每日使用时长统计
+
+    页面定期发送心跳，两次心跳之间的时间计入当天用量（超过 max_gap 的
+    间隔视为离开，只计 max_gap）。多个标签页同时在线时按墙钟时间计算，
+    不重复累计。用量只在内存中更新，后台线程每 flush_interval 秒把有变化
+    的数据整体原子写入 usage_record.json；时长限制也常驻内存，查询不读文件。
+    """
+
+    def __init__(self, path: str = 'usage_record.json', limit_path: str = 'time_limit.json',
+                 max_gap: float = 90.0, flush_interval: float = 10.0, retention_days: int = 90):
+        """
+        Args:
+            path: 用量记录文件 {日期: 分钟数}
+            limit_path: 每日时长限制文件 {"time_limit": 分钟数}
+            max_gap: 两次心跳间最多计入的秒数
+            flush_interval: 落盘间隔（秒）
+            retention_days: 用量记录保留的天数
+        """
+        self.path = path
+        self.limit_path = limit_path
+        self.max_gap = max_gap
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+
+        self._lock = threading.Lock()
+        self._minutes: Dict[str, float] = self._load_json(path)
+        self._time_limit: Optional[int] = self._load_json(limit_path).get('time_limit')
+        # 会话 -> 上次心跳时间；已计入用量的时间点（墙钟）
+        self._sessions: Dict[str, float] = {}
+        self._counted_until = 0.0
+        self._dirty = False
+        self._stats = {'heartbeats': 0, 'flushes': 0}
+
+        self._stop = threading.Event()
+        self._writer = threading.Thread(target=self._run_writer, name='usage-writer', daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    @property
+    def time_limit(self) -> Optional[int]:
+        with self._lock:
+            return self._time_limit
+
+    def set_time_limit(self, limit: Optional[int]):
+        with self._lock:
+            self._time_limit = limit
+        self._write_json(self.limit_path, {'time_limit': limit})
+
+    def heartbeat(self, session_id: str, active: bool = True) -> Dict[str, Any]:
+        """
+        记录一次心跳，返回最新的用量状态
+
+        Args:
+            session_id: 浏览器会话标识
+            active: False 表示页面转入后台，计入到此刻为止的时间后暂停计时
+        """
+        now = time.time()
+        with self._lock:
+            self._stats['heartbeats'] += 1
+            last = self._sessions.pop(session_id, None)
+            if active:
+                self._sessions[session_id] = now
+            if last is not None:
+                start = max(last, self._counted_until, now - self.max_gap)
+                if now > start:
+                    today = datetime.now().strftime('%Y-%m-%d')
+                    self._minutes[today] = self._minutes.get(today, 0.0) + (now - start) / 60
+                    self._counted_until = now
+                    self._dirty = True
+            # 清理长时间没有心跳的会话
+            for sid, beat in list(self._sessions.items()):
+                if now - beat > self.max_gap * 10:
+                    del self._sessions[sid]
+        return self.status()
+
+    def used_minutes(self, date: Optional[str] = None) -> float:
+        date = date or datetime.now().strftime('%Y-%m-%d')
+        with self._lock:
+            return self._minutes.get(date, 0.0)
+
+    def status(self) -> Dict[str, Any]:
+        """今日用量、限制和剩余时长"""
+        today = datetime.now().strftime('%Y-%m-%d')
+        with self._lock:
+            used = self._minutes.get(today, 0.0)
+            limit = self._time_limit
+        remaining = max(0.0, limit - used) if limit is not None else None
+        return {
+            'date': today,
+            'used_minutes': round(used, 2),
+            'time_limit': limit,
+            'remaining_minutes': round(remaining, 2) if remaining is not None else None,
+            'remaining_seconds': int(remaining * 60) if remaining is not None else None,
+            'exhausted': remaining is not None and remaining <= 0
+        }
+
+    def is_exhausted(self) -> bool:
+        return self.status()['exhausted']
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.time()
+            active = sum(1 for beat in self._sessions.values() if now - beat <= self.max_gap)
+            return dict(self._stats, active_sessions=active, pending_write=self._dirty)
+
+    def flush(self):
+        """把有变化的用量写入文件"""
+        with self._lock:
+            if not self._dirty:
+                return
+            oldest = datetime.fromtimestamp(time.time() - self.retention_days * 86400).strftime('%Y-%m-%d')
+            for date in [d for d in self._minutes if d < oldest]:
+                del self._minutes[date]
+            snapshot = {date: round(minutes, 2) for date, minutes in sorted(self._minutes.items())}
+            self._dirty = False
+        try:
+            self._write_json(self.path, snapshot)
+        except OSError as e:
+            logger.error(f"写入使用时长记录失败: {str(e)}")
+            with self._lock:
+                self._dirty = True
+            return
+        with self._lock:
+            self._stats['flushes'] += 1
+
+    def close(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._writer.join(timeout=5)
+        self.flush()
+
+    def _run_writer(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    @staticmethod
+    def _load_json(path: str) -> Dict[str, Any]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取 {path} 失败: {str(e)}")
+            return {}
+
+    @staticmethod
+    def _write_json(path: str, data: Dict[str, Any]):
+        # 先写临时文件再替换，进程中途退出也不会留下半截文件
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temp_path, path)
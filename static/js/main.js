@@ -7,10 +7,14 @@ class VoiceAssistant {
         this.currentSession = null;
         this.settings = this.loadSettings();
         this.currentTab = 'history';
+        this.audioQueue = Promise.resolve();
 
         // Live2D 相关属性
         this.live2dApp = null;
         this.live2dModel = null;
+        // 口型同步：当前播放的音频及其词边界时间轴
+        this.lipSync = null;
+        this.mouthOpen = 0;
         
         // 等待DOM加载完成
         // 注意：这里的逻辑已经简化，避免重复初始化
@@ -151,6 +155,9 @@ class VoiceAssistant {
             });
             this.live2dResizeObserver.observe(container);
 
+            // 每帧模型参数更新前按时间轴设置嘴型，覆盖动作中的口型参数
+            this.live2dModel.internalModel.on('beforeModelUpdate', () => this.applyLipSync());
+
             // 添加交互：点击模型时触发动作
             this.live2dModel.on('hit', (hitAreas) => {
                 if (hitAreas.length > 0) {
@@ -573,16 +580,41 @@ class VoiceAssistant {
         this.showLoading();
         this.updateStatus('llm', 'processing');
 
+        let streamingContent = null;
+        const speak = this.settings.enableTTS !== false;
+        let streamedAudio = false;
+        this.audioQueue = Promise.resolve();
         try {
-            const response = await this.callLLM(message);
+            const onAudio = speak ? (event) => {
+                streamedAudio = true;
+                this.enqueueAudio(event.audio, event.words);
+            } : null;
+            const response = await this.callLLMStream(message, (text) => {
+                // 收到首个片段后再创建回复气泡，之后逐段刷新
+                if (!streamingContent) {
+                    this.hideLoading();
+                    streamingContent = this.addMessageToUI('', 'assistant', false);
+                }
+                streamingContent.textContent = text;
+                this.elements.chatContainer.scrollTop = this.elements.chatContainer.scrollHeight;
+            }, onAudio);
             console.log('LLM响应:', response.substring(0, 100));
             
-            this.addMessage(response, 'assistant');
+            if (streamingContent) {
+                streamingContent.innerHTML = response;
+                this.conversationHistory.push({ role: 'assistant', content: response });
+                this.saveMessageToSession('assistant', response);
+            } else {
+                this.addMessage(response, 'assistant');
+            }
             
             this.updateStatus('llm', 'active');
             setTimeout(() => this.updateStatus('llm', ''), 1000);
             
-            if (this.settings.enableTTS !== false) {
+            if (speak && streamedAudio) {
+                // 语音已随回复按句合成，等待剩余句子播放完毕
+                await this.audioQueue;
+            } else if (speak) {
                 console.log('开始TTS处理...');
                 await this.speakText(response);
             }
@@ -591,6 +623,9 @@ class VoiceAssistant {
 
         } catch (error) {
             console.error('消息处理错误:', error);
+            if (streamingContent) {
+                streamingContent.closest('.message').remove();
+            }
             this.addMessage('抱歉，处理您的请求时出现了错误。', 'assistant');
             this.updateStatus('llm', 'error');
             this.showNotification('处理请求失败，请检查设置', 'error');
@@ -599,23 +634,88 @@ class VoiceAssistant {
         }
     }
 
-    // 调用LLM API
-    async callLLM(message) {
-        const messages = [...this.conversationHistory, { role: 'user', content: message }];
-        
-        const response = await fetch('/api/chat', {
+    // 构造聊天请求体：有会话ID时只发送本轮消息，由服务端从历史库拼出上下文
+    buildChatRequest(message, extra = {}) {
+        const body = {
+            provider: this.settings.llmProvider,
+            api_key: this.settings.apiKey,
+            model: this.settings.modelName,
+            temperature: this.settings.temperature,
+            conversation_id: this.currentSession ? this.currentSession.id : null,
+            ...extra
+        };
+        if (body.conversation_id) {
+            body.new_message = message;
+            // 本地已有的消息数，与服务端不一致时服务端要求重新同步
+            body.history_count = this.sessionHistory(message).length;
+        } else {
+            body.messages = [...this.conversationHistory, { role: 'user', content: message }];
+        }
+        return body;
+    }
+
+    // 发送聊天请求；服务端还没有该会话时先上传完整历史，再重试一次
+    async postChat(url, message, extra = {}) {
+        const send = () => fetch(url, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify(this.buildChatRequest(message, extra))
+        });
+
+        let response = await send();
+        if (response.status === 409) {
+            const errorData = await response.json();
+            if (errorData.code !== 'sync_required') {
+                throw new Error(errorData.error || '请求失败');
+            }
+            await this.syncSessionToServer(message);
+            response = await send();
+        }
+        return response;
+    }
+
+    // 当前会话的历史（不含本轮提问）
+    sessionHistory(pendingMessage) {
+        const history = this.currentSession.messages.map(({ role, content }) => ({ role, content }));
+        while (history.length && history[history.length - 1].role === 'user'
+               && history[history.length - 1].content === pendingMessage) {
+            history.pop();
+        }
+        return history;
+    }
+
+    // 把当前会话的历史（不含本轮提问）上传到服务端
+    async syncSessionToServer(pendingMessage) {
+        const history = this.sessionHistory(pendingMessage);
+
+        const response = await fetch('/api/history', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
             body: JSON.stringify({
-                provider: this.settings.llmProvider,
-                api_key: this.settings.apiKey,
-                model: this.settings.modelName,
-                messages: messages,
-                temperature: this.settings.temperature
+                conversation_id: this.currentSession.id,
+                title: this.currentSession.title,
+                messages: history
             })
         });
+        if (!response.ok) {
+            throw new Error('同步聊天历史失败');
+        }
+        console.log('会话历史已同步到服务端:', this.currentSession.id, history.length);
+    }
+
+    // 删除服务端保存的会话历史（失败不影响本地操作）
+    deleteServerHistory(sessionId) {
+        fetch(`/api/history?conversation_id=${encodeURIComponent(sessionId)}`, { method: 'DELETE' })
+            .catch(error => console.warn('删除服务端历史失败:', error));
+    }
+
+    // 调用LLM API
+    async callLLM(message) {
+        const response = await this.postChat('/api/chat', message);
 
         if (!response.ok) {
             const errorData = await response.json();
@@ -626,6 +726,62 @@ class VoiceAssistant {
         return data.response;
     }
 
+    // 流式调用LLM API (Server-Sent Events)，onUpdate 收到目前为止的完整文本；
+    // 传入 onAudio 时服务端会边生成边按句合成语音，按顺序回调每句音频
+    async callLLMStream(message, onUpdate, onAudio = null) {
+        if (!window.ReadableStream || !window.TextDecoder) {
+            return this.callLLM(message);
+        }
+
+        const response = await this.postChat('/api/chat/stream', message, {
+            speak: !!onAudio,
+            voice: this.settings.voiceSelect,
+            rate: this.settings.speechRate,
+            volume: this.settings.speechVolume,
+            tts_engine: this.settings.ttsEngine
+        });
+
+        if (!response.ok) {
+            const errorData = await response.json();
+            throw new Error(errorData.error || '请求失败');
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let fullText = '';
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                const data = rawEvent.split('\n')
+                    .filter(line => line.startsWith('data:'))
+                    .map(line => line.slice(5).trim())
+                    .join('\n');
+                if (!data) continue;
+
+                const event = JSON.parse(data);
+                if (event.type === 'token') {
+                    fullText += event.content;
+                    onUpdate(fullText);
+                } else if (event.type === 'audio' && onAudio) {
+                    onAudio(event);
+                } else if (event.type === 'error') {
+                    throw new Error(event.error || '请求失败');
+                }
+            }
+        }
+
+        return fullText;
+    }
+
     // 语音合成
     async speakText(text) {
         try {
@@ -664,33 +820,8 @@ class VoiceAssistant {
                     return;
                 }
                 
-                const audioUrl = URL.createObjectURL(audioBlob);
-                const audio = new Audio(audioUrl);
-                
-                return new Promise((resolve) => {
-                    audio.onended = () => {
-                        URL.revokeObjectURL(audioUrl);
-                        this.updateStatus('tts', 'active');
-                        setTimeout(() => this.updateStatus('tts', ''), 1000);
-                        resolve();
-                    };
-                    
-                    audio.onerror = (e) => {
-                        console.error('TTS: 音频播放失败', e);
-                        URL.revokeObjectURL(audioUrl);
-                        this.updateStatus('tts', 'error');
-                        resolve();
-                    };
-                    
-                    audio.play().then(() => {
-                        console.log('TTS: 音频播放成功启动');
-                    }).catch(err => {
-                        console.error('TTS: 音频播放启动失败:', err);
-                        URL.revokeObjectURL(audioUrl);
-                        this.updateStatus('tts', 'error');
-                        resolve();
-                    });
-                });
+                const words = await this.fetchLipSyncTiming(response.headers.get('X-TTS-Key'));
+                return this.playAudioBlob(audioBlob, words);
             } else {
                 const errorText = await response.text();
                 console.error('TTS API错误:', response.status, errorText);
@@ -704,6 +835,108 @@ class VoiceAssistant {
         }
     }
 
+    // 按音频的缓存键取口型时间轴，音频完整收到后服务端已写入缓存；取不到时退回音量驱动
+    async fetchLipSyncTiming(ttsKey) {
+        if (!ttsKey) return null;
+        try {
+            const response = await fetch(`/api/tts/timing/${encodeURIComponent(ttsKey)}`);
+            return response.ok ? await response.json() : null;
+        } catch (error) {
+            console.warn('TTS: 获取口型时间轴失败', error);
+            return null;
+        }
+    }
+
+    // 播放一段音频，播放结束（或失败）后 resolve；words 为服务端给出的词边界时间轴
+    playAudioBlob(audioBlob, words = null) {
+        const audioUrl = URL.createObjectURL(audioBlob);
+        const audio = new Audio(audioUrl);
+        audio.onplaying = () => {
+            this.lipSync = { audio, words: words || [], index: 0 };
+        };
+        const stopLipSync = () => {
+            if (this.lipSync && this.lipSync.audio === audio) {
+                this.lipSync = null;
+            }
+        };
+        
+        return new Promise((resolve) => {
+            audio.onended = () => {
+                stopLipSync();
+                URL.revokeObjectURL(audioUrl);
+                this.updateStatus('tts', 'active');
+                setTimeout(() => this.updateStatus('tts', ''), 1000);
+                resolve();
+            };
+            
+            audio.onerror = (e) => {
+                console.error('TTS: 音频播放失败', e);
+                stopLipSync();
+                URL.revokeObjectURL(audioUrl);
+                this.updateStatus('tts', 'error');
+                resolve();
+            };
+            
+            audio.play().then(() => {
+                console.log('TTS: 音频播放成功启动');
+            }).catch(err => {
+                console.error('TTS: 音频播放启动失败:', err);
+                URL.revokeObjectURL(audioUrl);
+                this.updateStatus('tts', 'error');
+                resolve();
+            });
+        });
+    }
+
+    // 按时间轴设置嘴型：在词的时长内按字数开合，词间闭合；
+    // 没有时间轴时用固定节奏开合，不需要逐帧分析音频
+    applyLipSync() {
+        if (!this.live2dModel) return;
+        let target = 0;
+        const sync = this.lipSync;
+        if (sync && !sync.audio.paused) {
+            const t = sync.audio.currentTime * 1000;
+            const words = sync.words;
+            if (words.length) {
+                while (sync.index < words.length && words[sync.index][0] + words[sync.index][1] < t) {
+                    sync.index++;
+                }
+                const word = words[sync.index];
+                if (word && t >= word[0]) {
+                    const progress = (t - word[0]) / Math.max(word[1], 1);
+                    const syllables = Math.max(1, word[2].length);
+                    target = 0.2 + 0.8 * Math.abs(Math.sin(Math.PI * syllables * progress));
+                }
+            } else {
+                target = 0.5 + 0.5 * Math.sin(t / 80);
+            }
+        } else if (this.mouthOpen < 0.01) {
+            return;
+        }
+        this.mouthOpen += (target - this.mouthOpen) * 0.5;
+        this.live2dModel.internalModel.coreModel.setParameterValueById('ParamMouthOpenY', this.mouthOpen);
+    }
+
+    base64ToBytes(base64) {
+        const binary = atob(base64);
+        const bytes = new Uint8Array(binary.length);
+        for (let i = 0; i < binary.length; i++) {
+            bytes[i] = binary.charCodeAt(i);
+        }
+        return bytes;
+    }
+
+    // 把流式返回的一句音频 (base64 MP3) 排入播放队列，按顺序播放
+    enqueueAudio(base64Audio, words = null) {
+        const audioBlob = new Blob([this.base64ToBytes(base64Audio)], { type: 'audio/mpeg' });
+        
+        this.audioQueue = this.audioQueue.then(() => {
+            this.updateStatus('tts', 'processing');
+            return this.playAudioBlob(audioBlob, words);
+        });
+        return this.audioQueue;
+    }
+
     // 创建新会话
     createNewSession() {
         const sessionId = Date.now().toString();
@@ -832,6 +1065,8 @@ class VoiceAssistant {
             this.conversationHistory.push({ role, content });
             this.saveMessageToSession(role, content);
         }
+
+        return messageDiv.querySelector('.message-content');
     }
 
     // 保存消息到会话
@@ -946,6 +1181,7 @@ class VoiceAssistant {
         
         const wasActive = this.conversationSessions[sessionIndex].isActive;
         this.conversationSessions.splice(sessionIndex, 1);
+        this.deleteServerHistory(sessionId);
         
         if (wasActive) {
             if (this.conversationSessions.length > 0) {
@@ -976,6 +1212,7 @@ class VoiceAssistant {
             if (this.currentSession) {
                 this.currentSession.messages = [];
                 this.currentSession.title = '新对话';
+                this.deleteServerHistory(this.currentSession.id);
             }
             this.conversationHistory = [];
             this.elements.chatContainer.innerHTML = `
@@ -1,11 +1,21 @@
-// 动态倒计时脚本
+// 动态倒计时脚本：页面在前台时向服务端发送使用时长心跳，并用返回的剩余时长校准倒计时
 (function() {
+    var HEARTBEAT_INTERVAL = 30000;
     var el = document.getElementById('remainingTime');
-    if (!el) return;
-    var minutes = parseInt(el.textContent);
-    if (isNaN(minutes) || minutes <= 0) return;
-    var seconds = minutes * 60;
+    var seconds = el ? parseInt(el.dataset.seconds) : NaN;
+    if (el && isNaN(seconds)) {
+        seconds = parseInt(el.textContent) * 60;
+    }
+    var limited = el && !isNaN(seconds);
     var locked = false;
+    var timer = null;
+    // 剩余时间提醒（秒 -> 朗读内容），文本与服务端预热的固定短语一致
+    var warnings = {300: '今日可用时长还剩5分钟。', 60: '今日可用时长还剩1分钟。'};
+    function speak(text) {
+        if (window.voiceAssistant && window.voiceAssistant.settings.enableTTS) {
+            window.voiceAssistant.speakText(text);
+        }
+    }
     function showLockScreen() {
         if (locked) return;
         locked = true;
@@ -37,20 +47,74 @@
         document.body.appendChild(lockDiv);
         document.body.style.overflow = 'hidden';
     }
-    function update() {
-        if (seconds <= 0) {
-            el.textContent = '0';
-            el.parentNode.style.color = '#ef4444';
-            el.parentNode.innerHTML += '（今日可用时长已用尽）';
-            clearInterval(timer);
-            showLockScreen();
+    function exhausted() {
+        el.textContent = '0';
+        el.parentNode.style.color = '#ef4444';
+        el.parentNode.innerHTML += '（今日可用时长已用尽）';
+        clearInterval(timer);
+        showLockScreen();
+    }
+    // 剩余秒数从 previous 变为 current 时，朗读跨过的提醒
+    function announce(previous, current) {
+        if (previous > 0 && current <= 0) {
+            speak('今日可用时长已用尽，请明天再来。');
             return;
         }
+        for (var threshold in warnings) {
+            if (previous > threshold && current <= threshold) {
+                speak(warnings[threshold]);
+            }
+        }
+    }
+    function render() {
         var m = Math.floor(seconds / 60);
         var s = seconds % 60;
         el.textContent = m + (s > 0 ? ('.' + (s < 10 ? '0' : '') + s) : '');
+    }
+    function update() {
+        // 页面在后台时服务端不计时，本地也暂停
+        if (locked || document.visibilityState !== 'visible') return;
+        if (seconds <= 0) {
+            exhausted();
+            return;
+        }
         seconds--;
+        announce(seconds + 1, seconds);
+        render();
+    }
+    function heartbeat(active) {
+        fetch('/api/usage/heartbeat', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ active: active }),
+            keepalive: !active
+        }).then(function(response) {
+            return response.ok ? response.json() : null;
+        }).then(function(usage) {
+            if (!usage || !limited || locked || usage.remaining_seconds === null) return;
+            announce(seconds, usage.remaining_seconds);
+            seconds = usage.remaining_seconds;
+            if (seconds <= 0) {
+                exhausted();
+            } else {
+                render();
+            }
+        }).catch(function() {});
+    }
+
+    heartbeat(true);
+    setInterval(function() {
+        if (document.visibilityState === 'visible') heartbeat(true);
+    }, HEARTBEAT_INTERVAL);
+    document.addEventListener('visibilitychange', function() {
+        heartbeat(document.visibilityState === 'visible');
+    });
+
+    if (!limited) return;
+    if (seconds <= 0) {
+        exhausted();
+        return;
     }
-    update();
-    var timer = setInterval(update, 1000);
+    render();
+    timer = setInterval(update, 1000);
 })();